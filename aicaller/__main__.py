@@ -12,6 +12,7 @@ from typing import Sequence, Optional, TextIO
 
 import inquirer
 import numpy as np
+import orjson
 import tiktoken
 from classconfig import Config, ConfigurableFactory, ConfigurableMixin, ConfigurableSubclassFactory
 from classconfig.classes import subclasses, sub_cls_from_its_name
@@ -25,6 +26,8 @@ from aicaller.sample_assembler import APISampleAssembler, TemplateBasedAssembler
 from aicaller.template import Template, StringTemplate
 from aicaller.utils import read_potentially_malformed_json_result, TokenCounter
 
+JSONL_READ_BUFFER_SIZE = 1 << 20  # bytes, JSONL files are read sequentially line by line
+
 
 class CreateBatchWorkflow(ConfigurableMixin):
     """
@@ -39,8 +42,9 @@ class CreateBatchWorkflow(ConfigurableMixin):
 
         :param proc_path: Path to data.
         """
-        for req in self.convertor.convert(proc_path):
-            print(req)
+        sys.stdout.flush()
+        self.convertor.convert_to_file(sys.stdout.buffer, proc_path)
+        sys.stdout.buffer.flush()
 
 
 class InputTemplateConfig(ConfigurableMixin):
@@ -106,13 +110,14 @@ def load_requests_ids(p: str, expected_ids: None | set[str] = None) -> set[str]:
         return {i for i in expected_ids if (p / f"{i}.json").exists() or (p / f"{i}.txt").exists()}
 
     else:
-        with open(p, mode='r', encoding="utf-8") as f:
-            all_ids = [json.loads(l)["custom_id"] for l in f]
-            all_ids_cnt = len(all_ids)
-            all_ids = set(all_ids)
-            if all_ids_cnt != len(all_ids):
-                raise ValueError(f"At least one duplicate request id found in the file {p}.")
-            return all_ids
+        all_ids = set()
+        with open(p, mode='rb') as f:
+            for line in f:
+                request_id = orjson.loads(line)["custom_id"]
+                if request_id in all_ids:
+                    raise ValueError(f"At least one duplicate request id found in the file {p}.")
+                all_ids.add(request_id)
+        return all_ids
 
 
 class APISelector(ConfigurableMixin):
@@ -246,9 +251,9 @@ def batch_stats(args):
     tokenizers = {}
     number_of_tokens = []
     number_of_tokens_messages = []
-    with open(args.file, mode='r', encoding="utf-8") as f:
+    with open(args.file, mode='rb', buffering=JSONL_READ_BUFFER_SIZE) as f:
         for line in f:
-            record = json.loads(line)
+            record = orjson.loads(line)
             model = record["body"]["model"]
             model = model.rstrip("-mini")
             if model not in tokenizers:
@@ -275,9 +280,9 @@ def batch_tokens(args):
     """
 
     token_counter = TokenCounter()
-    with open(args.file, mode='r', encoding="utf-8") as f:
-        for i, line in enumerate(f):
-            record = json.loads(line)
+    with open(args.file, mode='rb', buffering=JSONL_READ_BUFFER_SIZE) as f:
+        for line in f:
+            record = orjson.loads(line)
             token_counter(record)
 
     print(token_counter.token_count)
@@ -295,13 +300,13 @@ def split_batch(args):
     output_path.mkdir(parents=True, exist_ok=True)
 
     token_counter = TokenCounter()
-    with open(args.file, mode='r', encoding="utf-8") as f:
-        for i, line in enumerate(f):
-            record = json.loads(line)
+    with open(args.file, mode='rb', buffering=JSONL_READ_BUFFER_SIZE) as f:
+        for line in f:
+            record = orjson.loads(line)
             token_cnt = token_counter(record)
 
             if number_of_tokens > 0 and number_of_tokens + token_cnt > args.max_tokens:
-                with open(output_path / f"batch_{file_cnt}.jsonl", mode='w', encoding="utf-8") as out:
+                with open(output_path / f"batch_{file_cnt}.jsonl", mode='wb') as out:
                     out.writelines(lines_cache)
                 lines_cache = []
                 number_of_tokens = 0
@@ -311,7 +316,7 @@ def split_batch(args):
             number_of_tokens += token_cnt
 
         if len(lines_cache) > 0:
-            with open(output_path / f"batch_{file_cnt}.jsonl", mode='w', encoding="utf-8") as out:
+            with open(output_path / f"batch_{file_cnt}.jsonl", mode='wb') as out:
                 out.writelines(lines_cache)
 
 
@@ -1,22 +1,27 @@
-import json
+import os
 import sys
+import tempfile
 import time
 from abc import abstractmethod
+from collections import deque
 from collections.abc import Iterable
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
 from typing import Generator, Container, Optional
 
+import numpy as np
+import orjson
 from google import genai
 from google.genai import errors as genai_errors
-from google.genai.types import GenerateContentResponse
 from ollama import Client as OllamaClient
-from openai import OpenAI, APIError, RateLimitError
+from openai import OpenAI, APIError, RateLimitError, NotFoundError
 from openai.types.batch import Batch
-from pydantic import ValidationError
+from pydantic import TypeAdapter
 
 from aicaller.api import APIOutput, APIResponseOpenAI, APIResponseOllama
 from aicaller.api.base import APIBase, APIRequest, APIResponseGoogleGenAI
 from aicaller.api.utils import GoogleGenAIAPIMixin
+from aicaller.utils import iter_file_lines
 
 
 class API(APIBase):
@@ -38,13 +43,30 @@ class API(APIBase):
         """
         Processes a list of requests.
 
+        Requests are sent from a thread pool with at most `concurrency` requests in flight. Consecutive requests are
+        submitted at least `process_requests_interval` seconds apart, the time spent waiting for results counts
+        towards the interval.
+
         :param requests: Iterable of request dictionaries.
-        :return: Processed requests
+        :return: Processed requests in the same order as the input requests
         """
-        for i, request in enumerate(requests):
-            if i > 0 and self.process_requests_interval > 0:
-                time.sleep(self.process_requests_interval)
-            yield self.process_single_request(request)
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            pending = deque()
+            next_allowed = time.monotonic()
+            for request in requests:
+                if self.process_requests_interval > 0:
+                    now = time.monotonic()
+                    if now < next_allowed:
+                        time.sleep(next_allowed - now)
+                    next_allowed = time.monotonic() + self.process_requests_interval
+
+                pending.append(executor.submit(self.process_single_request, request))
+
+                while pending and (len(pending) >= self.concurrency or pending[0].done()):
+                    yield pending.popleft().result()
+
+            while pending:
+                yield pending.popleft().result()
 
     def process_line(self, path_to_file: str, line: int) -> APIOutput:
         """
@@ -56,48 +78,89 @@ class API(APIBase):
         :raises ValueError: If the line is not found.
         :raises ValidationError: If the line is not a valid request.
         """
-        with open(path_to_file, mode='r') as f:
-            for i, l in enumerate(f):
-                if i == line:
-                    line = l
-                    break
-            else:
-                raise ValueError(f"Line {line} not found.")
-            record = APIRequest.model_validate_json(line.strip())
+        offsets = self._get_line_index(path_to_file)
+        if line < 0 or line >= len(offsets):
+            raise ValueError(f"Line {line} not found.")
+
+        with open(path_to_file, mode='rb') as f:
+            f.seek(int(offsets[line]))
+            record = APIRequest.model_validate_json(f.readline())
 
         return self.process_single_request(record)
 
-    @staticmethod
-    def read_request_file(path_to_file: str) -> Iterable[APIRequest]:
+    LINE_INDEX_HEADER_SIZE = 2  # number of uint64 values (size, mtime) at the start of the line index
+
+    @classmethod
+    def _get_line_index(cls, path_to_file: str) -> np.ndarray:
         """
-        Reads requests from a file.
+        Obtains byte offsets of the starts of lines in the file.
 
-        :param path_to_file: Path to the file with requests.
-        :return: Iterable of requests
-        :raises ValueError: If the file is empty or not found.
-        :raises ValidationError: If the file contains invalid requests.
+        The index is cached next to the file (with .lineidx suffix). It starts with a header containing the size and
+        mtime of the indexed file and it is rebuilt when they do not match or the index can't be loaded.
+
+        :param path_to_file: Path to the file.
+        :return: Array of line offsets.
         """
-        with open(path_to_file, "r") as f:
-            for line in f:
-                yield APIRequest.model_validate_json(line)
+        idx_path = path_to_file + ".lineidx"
+        stat = os.stat(path_to_file)
+        header = np.array([stat.st_size, stat.st_mtime_ns], dtype=np.uint64)
+
+        try:
+            index = np.memmap(idx_path, dtype=np.uint64, mode="r")
+            if len(index) >= cls.LINE_INDEX_HEADER_SIZE \
+                    and np.array_equal(index[:cls.LINE_INDEX_HEADER_SIZE], header):
+                return index[cls.LINE_INDEX_HEADER_SIZE:]
+        except (OSError, ValueError):
+            # missing, empty, or corrupted index, let's rebuild it
+            pass
+
+        offsets = np.fromiter((offset for offset, _ in iter_file_lines(path_to_file)), dtype=np.uint64)
+        try:
+            # written to a temporary file first so that a concurrent reader never sees a partially written index
+            fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(idx_path) + ".",
+                                            dir=os.path.dirname(idx_path) or ".")
+        except OSError:
+            # the index is just a cache, so it is fine when it can't be saved (e.g. read-only directory)
+            return offsets
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.concatenate((header, offsets)).tofile(f)
+            os.replace(tmp_path, idx_path)
+        except OSError:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+        return offsets
 
     def process_request_file(self, path_to_file: str, skip: Optional[Container[str]] = None) -> Generator[
         APIOutput, None, None]:
         """
-        Simulates the batch request, but uses normal synchronous API calls.
+        Simulates the batch request, but uses normal synchronous API calls sent from a thread pool.
 
         :param path_to_file: Path to the file with requests.
         :param skip: Set of custom request IDs to skip.
         :return: Results for each request
         """
-        for i, record in enumerate(self.read_request_file(path_to_file)):
-            if skip is not None and record.custom_id in skip:
-                continue
+        yield from self.process_requests(
+            record for record in self.read_request_file(path_to_file)
+            if skip is None or record.custom_id not in skip
+        )
 
-            if i > 0 and self.process_requests_interval > 0:
-                time.sleep(self.process_requests_interval)
+    def read_batch_file(self, path_to_file: str) -> dict[str, APIRequest]:
+        """
+        Reads requests from a batch file.
 
-            yield self.process_single_request(record)
+        :param path_to_file: Path to the file with requests.
+        :return: Dictionary of requests indexed by custom_id
+        :raises ValueError: If there is a duplicate custom_id.
+        """
+        samples = {}
+        for record in self.read_request_file(path_to_file):
+            if record.custom_id in samples:
+                raise ValueError(f"Duplicate custom_id found: {record.custom_id}")
+            samples[record.custom_id] = record
+        return samples
 
     @abstractmethod
     def batch_request(self, path_to_file: str) -> dict:
@@ -114,8 +177,8 @@ class API(APIBase):
         """
         Sends requests to API and waits for the batch request to finish.
 
-        In case it receives an error that the enqueued token limit was reached, it will wait for the pool_interval
-        and try again.
+        In case it receives an error that the enqueued token limit was reached, it will wait (with exponential
+        backoff up to the pool_interval) and try again.
 
         :param path_to_file: Path to the file with requests.
         :return: Content of the output file if the batch request was successful.
@@ -124,12 +187,12 @@ class API(APIBase):
         ...
 
     @abstractmethod
-    def wait_for_batch_request(self, response: Batch) -> str:
+    def wait_for_batch_request(self, response: Batch) -> bytes:
         """
         Waits for the batch request to finish and downloads the results.
 
         :param response: Batch request response from API.
-        :return: Content of the output file if the batch request was successful.
+        :return: Raw content of the output file if the batch request was successful.
         :raises APIError: If the batch request failed.
         """
         ...
@@ -143,22 +206,27 @@ class OpenAPI(API):
 
     def __post_init__(self):
         self.client = OpenAI(api_key=self.api_key, base_url=self.base_url)
+        self.uploaded_files: dict[tuple[str, int, int], str] = {}  # (path, mtime, size) -> id of uploaded batch file
 
     def process_single_request(self, request: APIRequest) -> APIOutput:
         try:
+            delays = self.pool_delays()
             while True:
                 try:
-                    response = self.client.chat.completions.create(**request.body.model_dump(exclude={"type"}))
+                    response = self.client.chat.completions.create(
+                        **request.body.model_dump(exclude=self.body_arguments_blacklist, warnings=False)
+                    )
                     break
                 except RateLimitError:
-                    print(f"Rate limit reached. Waiting for {self.pool_interval} seconds.", flush=True,
+                    delay = next(delays)
+                    print(f"Rate limit reached. Waiting for {delay:.1f} seconds.", flush=True,
                           file=sys.stderr)
-                    time.sleep(self.pool_interval)
+                    time.sleep(delay)
 
             return APIOutput(
                 custom_id=request.custom_id,
                 response=APIResponseOpenAI(
-                    body=response.model_dump(),
+                    body=response,
                     structured=request.body.structured
                 ),
                 error=None
@@ -170,6 +238,30 @@ class OpenAPI(API):
                 error=str(e)
             )
 
+    def _prepare_batch(self, path_to_file: str, convert: bool = True) -> tuple[Optional[BytesIO], dict[str, bool]]:
+        """
+        Converts a file to OpenAI batch format and collects information needed for reading the results in a single
+        pass over the file.
+
+        :param path_to_file: Path to the file with requests.
+        :param convert: If False the requests are not converted, which is useful when the file was already uploaded.
+        :return: BytesIO object with converted requests (None when convert is False) and dictionary mapping
+            custom_id to the flag whether the response is expected to be structured.
+        :raises ValueError: If there is a duplicate custom_id.
+        """
+        structured = {}
+        buffer = bytearray()
+        for line in self._iter_jsonl_mmap(path_to_file):
+            record = APIRequest.model_validate_json(line)
+            if record.custom_id in structured:
+                raise ValueError(f"Duplicate custom_id found: {record.custom_id}")
+            structured[record.custom_id] = record.body.structured
+
+            if convert:
+                buffer.extend(orjson.dumps(record.model_dump(exclude={"body": self.body_arguments_blacklist})))
+                buffer.append(0x0a)  # newline
+        return BytesIO(buffer) if convert else None, structured
+
     def convert_batch_file(self, path_to_file: str) -> BytesIO:
         """
         Converts a file to OpenAI batch format.
@@ -180,77 +272,108 @@ class OpenAPI(API):
         :param path_to_file: Path to the file with requests.
         :return: BytesIO object with converted requests.
         """
-        output = BytesIO()
-        with open(path_to_file, "r") as f:
-            for line in f:
-                record = APIRequest.model_validate_json(line.strip())
-                output.write(record.model_dump_json(
-                    exclude={"body": self.body_arguments_blacklist}
-                ).encode() + b"\n")
-        output.seek(0)
-        return output
+        return self._prepare_batch(path_to_file)[0]
 
-    def batch_request(self, path_to_file: str) -> Batch:
+    @staticmethod
+    def _uploaded_file_key(path_to_file: str) -> tuple[str, int, int]:
         """
-        Sends requests to OpenAI API.
+        Creates key identifying the input file in the cache of uploaded files.
 
         :param path_to_file: Path to the file with requests.
-        :return: Batch request response
+        :return: Absolute path, modification time, and size of the file.
+        """
+        stat = os.stat(path_to_file)
+        return os.path.abspath(path_to_file), stat.st_mtime_ns, stat.st_size
+
+    def _upload_batch_file(self, path_to_file: str, converted_batch: Optional[BytesIO] = None) -> str:
         """
+        Uploads converted requests for a batch.
 
-        batch_input_file = self.client.files.create(
-            file=self.convert_batch_file(path_to_file),
+        The id of uploaded file is remembered for given input file (its path, modification time and size), and it
+        is reused as long as the uploaded file still exists. Thus, retried batch requests do not upload the same
+        content again.
+
+        The converted requests are kept in a seekable in-memory buffer instead of being streamed through a pipe
+        while they are converted, because the upload needs to know its size in advance.
+
+        :param path_to_file: Path to the file with requests.
+        :param converted_batch: Requests from the file converted to OpenAI batch format. If None, the file is
+            converted only when it needs to be uploaded.
+        :return: Id of the uploaded file.
+        """
+        key = self._uploaded_file_key(path_to_file)
+
+        file_id = self.uploaded_files.get(key)
+        if file_id is not None:
+            try:
+                self.client.files.retrieve(file_id)
+                return file_id
+            except NotFoundError:
+                del self.uploaded_files[key]
+
+        if converted_batch is None:
+            converted_batch = self.convert_batch_file(path_to_file)
+        converted_batch.seek(0)
+        file_id = self.client.files.create(
+            file=converted_batch,
             purpose="batch"
-        )
+        ).id
+        self.uploaded_files[key] = file_id
+        return file_id
+
+    def _upload_and_create_batch(self, converted_batch: Optional[BytesIO], path_to_file: str) -> Batch:
+        """
+        Uploads already converted requests and creates the batch.
+
+        :param converted_batch: Requests from the file converted to OpenAI batch format. If None, the file is
+            converted only when it was not uploaded yet.
+        :param path_to_file: Path to the file with requests.
+        :return: Batch request response
+        """
         return self.client.batches.create(
-            input_file_id=batch_input_file.id,
+            input_file_id=self._upload_batch_file(path_to_file=path_to_file, converted_batch=converted_batch),
             endpoint="/v1/chat/completions",
             completion_window="24h"
         )
 
-    def read_batch_file(self, path_to_file: str) -> dict[str, APIRequest]:
+    def batch_request(self, path_to_file: str) -> Batch:
         """
-        Reads requests from a batch file.
+        Sends requests to OpenAI API.
 
         :param path_to_file: Path to the file with requests.
-        :return: Dictionary of requests indexed by custom_id
+        :return: Batch request response
         """
-
-        with open(path_to_file, "r") as f:
-            samples = {}
-            for line in f:
-                record = APIRequest.model_validate_json(line.strip())
-                if record.custom_id in samples:
-                    raise ValueError(f"Duplicate custom_id found: {record.custom_id}")
-                samples[record.custom_id] = record
-        return samples
+        return self._upload_and_create_batch(converted_batch=None, path_to_file=path_to_file)
 
     def batch_request_and_wait(self, path_to_file: str) -> list[APIOutput]:
         """
         Sends requests to OpenAI API and waits for the batch request to finish.
 
-        In case it receives an error that the enqueued token limit was reached, it will wait for the pool_interval
-        and try again.
+        In case it receives an error that the enqueued token limit was reached, it will wait (with exponential
+        backoff up to the pool_interval) and try again.
 
         :param path_to_file: Path to the file with requests.
         :return: Content of the output file if the batch request was successful.
         :raises APIError: If the batch request failed.
         """
 
+        converted_batch, structured = self._prepare_batch(
+            path_to_file, convert=self._uploaded_file_key(path_to_file) not in self.uploaded_files
+        )
+        delays = self.pool_delays()
         while True:
             try:
-                batch_samples = self.read_batch_file(path_to_file)
-                response = self.batch_request(path_to_file)
+                response = self._upload_and_create_batch(converted_batch=converted_batch, path_to_file=path_to_file)
                 file_content = self.wait_for_batch_request(response)
                 content = []
 
-                for line in file_content.splitlines():
-                    record = json.loads(line)
+                for line in self._iter_lines(file_content):
+                    record = orjson.loads(line)
                     content.append(APIOutput(
                         custom_id=record["custom_id"],
                         response=APIResponseOpenAI(
                             body=record["response"]["body"],
-                            structured=batch_samples[record["custom_id"]].body.structured
+                            structured=structured[record["custom_id"]]
                         ),
                         error=None
                     ))
@@ -258,50 +381,55 @@ class OpenAPI(API):
                 return content
             except APIError as e:
                 if "Enqueued token limit reached for" in e.message:
-                    print("Enqueued token limit reached. Waiting for the pool interval.", flush=True,
+                    delay = next(delays)
+                    print(f"Enqueued token limit reached. Waiting for {delay:.1f} seconds.", flush=True,
                           file=sys.stderr)
-                    time.sleep(self.pool_interval)
+                    time.sleep(delay)
                 else:
                     raise e
 
-    def wait_for_batch_request(self, response: Batch) -> str:
+    def wait_for_batch_request(self, response: Batch) -> bytes:
         """
         Waits for the batch request to finish and downloads the results.
 
         :param response: Batch request response from OpenAI API.
-        :return: Content of the output file if the batch request was successful.
+        :return: Raw content of the output file if the batch request was successful.
         :raises APIError: If the batch request failed.
         """
 
         batch_id = response.id
+        delays = self.pool_delays()
         while True:
             batch: Batch = self.client.batches.retrieve(batch_id)
             if batch.status == "completed":
                 break
             if batch.status in {"failed", "canceled", "expired"}:
                 break
-            time.sleep(self.pool_interval)
+            time.sleep(next(delays))
 
         if batch.status == "completed":
             file_response = self.client.files.content(batch.output_file_id)
-            return file_response.text
+            return file_response.content
 
         raise APIError("Batch request failed with status: " + batch.status, None, body=batch)
 
 
 class OllamaAPI(API):
+    body_arguments_blacklist: set[str] = {"type"}
 
     def __post_init__(self):
         self.client = OllamaClient(host=self.base_url)
 
     def process_single_request(self, request: APIRequest) -> APIOutput:
         try:
-            response = self.client.chat(**request.body.model_dump(exclude={"type"}))
+            response = self.client.chat(
+                **request.body.model_dump(exclude=self.body_arguments_blacklist, warnings=False)
+            )
 
             return APIOutput(
                 custom_id=request.custom_id,
                 response=APIResponseOllama(
-                    body=response.model_dump(),
+                    body=response,
                     structured=request.body.structured
                 ),
                 error=None
@@ -319,11 +447,12 @@ class OllamaAPI(API):
     def batch_request_and_wait(self, path_to_file: str) -> str:
         raise NotImplementedError("Batch request is not supported by Ollama API.")
 
-    def wait_for_batch_request(self, response: Batch) -> str:
+    def wait_for_batch_request(self, response: Batch) -> bytes:
         raise NotImplementedError("Batch request is not supported by Ollama API.")
 
 
 class GoogleGenAIAPI(API, GoogleGenAIAPIMixin):
+    contents_adapter: TypeAdapter[list[genai.types.Content]] = TypeAdapter(list[genai.types.Content])
 
     def __post_init__(self):
         if self.base_url is not None:
@@ -333,6 +462,7 @@ class GoogleGenAIAPI(API, GoogleGenAIAPIMixin):
 
     def process_single_request(self, request: APIRequest) -> APIOutput:
         try:
+            delays = self.pool_delays()
             while True:
                 try:
                     raw_response = self.client.models.generate_content(
@@ -343,19 +473,17 @@ class GoogleGenAIAPI(API, GoogleGenAIAPIMixin):
                     break
                 except genai_errors.APIError as e:
                     if e.code == 503:
-                        print(f"Got 503 UNAVAILABLE error: {e.message}", flush=True,
+                        delay = next(delays)
+                        print(f"Got 503 UNAVAILABLE error: {e.message}. Waiting for {delay:.1f} seconds.", flush=True,
                               file=sys.stderr)
-                        time.sleep(self.pool_interval)
+                        time.sleep(delay)
                     else:
                         raise e
 
-            response = raw_response.model_dump()
-            response["text"] = raw_response.text
-
             return APIOutput(
                 custom_id=request.custom_id,
                 response=APIResponseGoogleGenAI(
-                    body=response,
+                    body=raw_response,
                     structured=request.body.structured
                 ),
                 error=None
@@ -367,56 +495,78 @@ class GoogleGenAIAPI(API, GoogleGenAIAPIMixin):
                 error=str(e)
             )
 
-    def convert_batch_file(self, path_to_file: str) -> tuple[BytesIO, str]:
+    def _prepare_batch(self, path_to_file: str) -> tuple[BytesIO, str, dict[str, bool]]:
         """
-        Converts a file to Google GenAI batch format (JSONL).
+        Converts a file to Google GenAI batch format (JSONL) and collects information needed for reading
+        the results in a single pass over the file.
 
         :param path_to_file: Path to the file with requests.
-        :return: BytesIO object with converted requests and the model name used in the batch.
+        :return: BytesIO object with converted requests, the model name used in the batch and dictionary
+            mapping custom_id to the flag whether the response is expected to be structured.
+        :raises ValueError: If the requests use different models or there is a duplicate custom_id.
         """
 
         first_model = None
+        structured = {}
+
+        buffer = bytearray()
+        for line in self._iter_jsonl_mmap(path_to_file):
+            record = APIRequest.model_validate_json(line)
+
+            if first_model is None:
+                first_model = record.body.model
+            elif record.body.model != first_model:
+                raise ValueError(
+                    f"All requests in a batch must use the same model. Found {record.body.model}, expected {first_model}.")
+
+            if record.custom_id in structured:
+                raise ValueError(f"Duplicate custom_id found: {record.custom_id}")
+            structured[record.custom_id] = record.body.structured
+
+            config = self.get_config(record)
+            google_request = {
+                "contents": self.contents_adapter.dump_python(
+                    self.get_conversion_history(record), exclude_defaults=True
+                ),
+                "generation_config":
+                    config.model_dump(exclude_defaults=True, exclude={"system_instruction"}) if config else {}
+            }
 
-        output = BytesIO()
-        with open(path_to_file, "r") as f:
-            for line in f:
-                record = APIRequest.model_validate_json(line.strip())
-
-                if first_model is None:
-                    first_model = record.body.model
-                elif record.body.model != first_model:
-                    raise ValueError(
-                        f"All requests in a batch must use the same model. Found {record.body.model}, expected {first_model}.")
-                config = self.get_config(record)
-                google_request = {
-                    "contents": [
-                        c.model_dump(exclude_defaults=True) for c in self.get_conversion_history(record)
-                    ],
-                    "generation_config":
-                        config.model_dump(exclude_defaults=True, exclude={"system_instruction"}) if config else {}
-                }
-
-                if config and config.system_instruction:
-                    google_request["system_instruction"] = config.system_instruction.model_dump(exclude_defaults=True)
-
-                batch_item = {
-                    "key": record.custom_id,
-                    "request": google_request
-                }
-                output.write(json.dumps(batch_item).encode() + b"\n")
-        output.seek(0)
-        return output, first_model
+            if config and config.system_instruction:
+                google_request["system_instruction"] = config.system_instruction.model_dump(exclude_defaults=True)
 
-    def batch_request(self, path_to_file: str) -> genai.types.BatchJob:
+            batch_item = {
+                "key": record.custom_id,
+                "request": google_request
+            }
+            buffer.extend(orjson.dumps(batch_item))
+            buffer.append(0x0a)  # newline
+        return BytesIO(buffer), first_model, structured
+
+    def convert_batch_file(self, path_to_file: str) -> tuple[BytesIO, str]:
         """
-        Sends requests to Google GenAI API.
+        Converts a file to Google GenAI batch format (JSONL).
 
         :param path_to_file: Path to the file with requests.
-        :return: Batch job object
+        :return: BytesIO object with converted requests and the model name used in the batch.
         """
-        converted_batch, model_name = self.convert_batch_file(path_to_file)
+        output, first_model, _ = self._prepare_batch(path_to_file)
+        return output, first_model
+
+    def _upload_and_create_batch(self, converted_batch: BytesIO, model_name: str) -> genai.types.BatchJob:
+        """
+        Uploads already converted requests and creates the batch job.
+
+        The converted requests are kept in a seekable in-memory buffer instead of being streamed through a pipe
+        while they are converted, because the resumable upload needs a seekable stream of known size and the same
+        buffer is uploaded again when the batch creation is retried.
 
+        :param converted_batch: Requests converted to Google GenAI batch format.
+        :param model_name: Name of the model used in the batch.
+        :return: Batch job object
+        """
         # Upload the file
+        converted_batch.seek(0)
         uploaded_file = self.client.files.upload(
             file=converted_batch,
             config=genai.types.UploadFileConfig(mime_type='jsonl')
@@ -429,22 +579,15 @@ class GoogleGenAIAPI(API, GoogleGenAIAPIMixin):
         )
         return batch_job
 
-    def read_batch_file(self, path_to_file: str) -> dict[str, APIRequest]:
+    def batch_request(self, path_to_file: str) -> genai.types.BatchJob:
         """
-        Reads requests from a batch file.
+        Sends requests to Google GenAI API.
 
         :param path_to_file: Path to the file with requests.
-        :return: Dictionary of requests indexed by custom_id
+        :return: Batch job object
         """
-
-        with open(path_to_file, "r") as f:
-            samples = {}
-            for line in f:
-                record = APIRequest.model_validate_json(line.strip())
-                if record.custom_id in samples:
-                    raise ValueError(f"Duplicate custom_id found: {record.custom_id}")
-                samples[record.custom_id] = record
-        return samples
+        converted_batch, model_name = self.convert_batch_file(path_to_file)
+        return self._upload_and_create_batch(converted_batch=converted_batch, model_name=model_name)
 
     def batch_request_and_wait(self, path_to_file: str) -> list[APIOutput]:
         """
@@ -455,15 +598,16 @@ class GoogleGenAIAPI(API, GoogleGenAIAPIMixin):
         :raises APIError: If the batch request failed.
         """
 
+        converted_batch, model_name, structured = self._prepare_batch(path_to_file)
+        delays = self.pool_delays()
         while True:
             try:
-                batch_samples = self.read_batch_file(path_to_file)
-                response = self.batch_request(path_to_file)
+                response = self._upload_and_create_batch(converted_batch=converted_batch, model_name=model_name)
                 file_content = self.wait_for_batch_request(response)
                 content = []
 
-                for line in file_content.splitlines():
-                    raw_record = json.loads(line)
+                for line in self._iter_lines(file_content):
+                    raw_record = orjson.loads(line)
                     key = raw_record["key"]
                     if "error" in raw_record:
                         content.append(APIOutput(
@@ -473,19 +617,18 @@ class GoogleGenAIAPI(API, GoogleGenAIAPIMixin):
                         ))
                         continue
                     try:
-                        raw_response = GenerateContentResponse.model_validate(raw_record["response"])
-                        response = raw_response.model_dump()
-                        response["text"] = raw_response.text
+                        response = raw_record["response"]
+                        response["text"] = self.extract_text(response)
 
                         content.append(APIOutput(
                             custom_id=key,
                             response=APIResponseGoogleGenAI(
                                 body=response,
-                                structured=batch_samples[key].body.structured
+                                structured=structured[key]
                             ),
                             error=None
                         ))
-                    except ValidationError as e:
+                    except (AttributeError, TypeError) as e:
                         content.append(APIOutput(
                             custom_id=key,
                             response=None,
@@ -495,18 +638,19 @@ class GoogleGenAIAPI(API, GoogleGenAIAPIMixin):
                 return content
             except APIError as e:
                 if "Enqueued token limit reached for" in e.message:
-                    print("Enqueued token limit reached. Waiting for the pool interval.", flush=True,
+                    delay = next(delays)
+                    print(f"Enqueued token limit reached. Waiting for {delay:.1f} seconds.", flush=True,
                           file=sys.stderr)
-                    time.sleep(self.pool_interval)
+                    time.sleep(delay)
                 else:
                     raise e
 
-    def wait_for_batch_request(self, batch_job: genai.types.BatchJob) -> str:
+    def wait_for_batch_request(self, batch_job: genai.types.BatchJob) -> bytes:
         """
         Waits for the batch request to finish and downloads the results.
 
         :param batch_job: Batch job object.
-        :return: Content of the output file.
+        :return: Raw content of the output file.
         :raises Exception: If the batch request failed.
         """
 
@@ -519,13 +663,14 @@ class GoogleGenAIAPI(API, GoogleGenAIAPIMixin):
             'JOB_STATE_EXPIRED',
         ])
 
+        delays = self.pool_delays()
         while True:
             batch_job = self.client.batches.get(name=job_name)  # Initial get
 
             if batch_job.state.name in completed_states:
                 break
 
-            time.sleep(self.pool_interval)
+            time.sleep(next(delays))
 
         if batch_job.state.name == 'JOB_STATE_SUCCEEDED':
             if not (batch_job.dest and batch_job.dest.file_name):
@@ -533,8 +678,7 @@ class GoogleGenAIAPI(API, GoogleGenAIAPIMixin):
                 raise APIError("Batch job succeeded but no output file found.", None, body=batch_job)
 
             result_file_name = batch_job.dest.file_name
-            file_content = self.client.files.download(file=result_file_name)
-            return file_content.decode("utf-8")
+            return self.client.files.download(file=result_file_name)
 
         else:
             raise APIError("Batch request failed with state: " + batch_job.state.name, None, body=batch_job)
@@ -43,18 +43,6 @@ class APIAsync(APIBase):
         for o in as_completed(self.process_single_request(request) for request in requests):
             yield await o
 
-    @staticmethod
-    def read_request_file(path_to_file: str) -> Iterable[APIRequest]:
-        """
-        Reads requests from a file.
-
-        :param path_to_file: Path to the file with requests.
-        :return: Iterable of request dictionaries
-        """
-        with open(path_to_file, "r") as f:
-            for line in f:
-                yield APIRequest.model_validate_json(line)
-
     def process_request_file(self, path_to_file: str, skip: Optional[Container[str]] = None) -> Generator[APIOutput, None, None]:
         """
         Processes requests from a file, skipping those with IDs in the skip set.
@@ -101,6 +89,7 @@ class OpenAsyncAPI(APIAsync):
     """
     Handles asynchronous requests to the OpenAI API.
     """
+    body_arguments_blacklist: set[str] = {"type"}
 
     def __post_init__(self):
         self.client = AsyncOpenAI(
@@ -111,19 +100,23 @@ class OpenAsyncAPI(APIAsync):
     async def process_single_request(self, request: APIRequest) -> APIOutput:
         async with self.semaphore:
             try:
+                delays = self.pool_delays()
                 while True:
                     try:
-                        response = await self.client.chat.completions.create(**request.body.model_dump(exclude={"type"}))
+                        response = await self.client.chat.completions.create(
+                            **request.body.model_dump(exclude=self.body_arguments_blacklist, warnings=False)
+                        )
                         break
                     except RateLimitError:
-                        print(f"Rate limit reached. Waiting for {self.pool_interval} seconds.", flush=True,
+                        delay = next(delays)
+                        print(f"Rate limit reached. Waiting for {delay:.1f} seconds.", flush=True,
                               file=sys.stderr)
-                        time.sleep(self.pool_interval)
+                        time.sleep(delay)
 
                 return APIOutput(
                     custom_id=request.custom_id,
                     response=APIResponseOpenAI(
-                        body=response.model_dump(),
+                        body=response,
                         structured=request.body.structured
                     ),
                     error=None
@@ -140,6 +133,7 @@ class OllamaAsyncAPI(APIAsync):
     """
     Handles asynchronous requests to the Ollama API.
     """
+    body_arguments_blacklist: set[str] = {"type"}
 
     def __post_init__(self):
         self.client = AsyncClient(host=self.base_url)
@@ -148,12 +142,14 @@ class OllamaAsyncAPI(APIAsync):
     async def process_single_request(self, request: APIRequest) -> APIOutput:
         async with self.semaphore:
             try:
-                response = await self.client.chat(**request.body.model_dump(exclude={"type"}, exclude_none=True))
+                response = await self.client.chat(
+                    **request.body.model_dump(exclude=self.body_arguments_blacklist, exclude_none=True, warnings=False)
+                )
 
                 return APIOutput(
                     custom_id=request.custom_id,
                     response=APIResponseOllama(
-                        body=response.model_dump(),
+                        body=response,
                         structured=request.body.structured
                     ),
                     error=None
@@ -181,6 +177,7 @@ class GoogleGenAIAsyncAPI(APIAsync, GoogleGenAIAPIMixin):
     async def process_single_request(self, request: APIRequest) -> APIOutput:
         async with self.semaphore:
             try:
+                delays = self.pool_delays()
                 while True:
                     try:
                         raw_response = await self.client.models.generate_content(
@@ -191,19 +188,17 @@ class GoogleGenAIAsyncAPI(APIAsync, GoogleGenAIAPIMixin):
                         break
                     except genai_errors.APIError as e:
                         if e.code == 503:
-                            print(f"Got 503 UNAVAILABLE error: {e.message}", flush=True,
+                            delay = next(delays)
+                            print(f"Got 503 UNAVAILABLE error: {e.message}. Waiting for {delay:.1f} seconds.", flush=True,
                                   file=sys.stderr)
-                            time.sleep(self.pool_interval)
+                            time.sleep(delay)
                         else:
                             raise e
 
-                response = raw_response.model_dump()
-                response["text"] = raw_response.text
-
                 return APIOutput(
                     custom_id=request.custom_id,
                     response=APIResponseGoogleGenAI(
-                        body=response,
+                        body=raw_response,
                         structured=request.body.structured
                     ),
                     error=None
@@ -1,9 +1,14 @@
+import mmap
+import random
 from abc import ABC, abstractmethod
-from typing import Optional, Literal, Union, Type
+from collections.abc import Iterable
+from typing import Optional, Literal, Union, Type, Generator
 
 from classconfig import ConfigurableValue, ConfigurableMixin
 from classconfig.validators import StringValidator, MinValueIntegerValidator
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, field_serializer
+
+from aicaller.utils import iter_lines, iter_file_lines
 
 
 class APIConfigMixin(ConfigurableMixin):
@@ -15,17 +20,22 @@ class APIConfigMixin(ConfigurableMixin):
     api_key: str = ConfigurableValue(desc="API key.", validator=StringValidator())
     base_url: Optional[str] = ConfigurableValue(desc="Base URL for API.", user_default=None, voluntary=True)
     pool_interval: Optional[int] = ConfigurableValue(
-        desc="Interval in seconds for checking the status of the batch request.",
+        desc="Maximal interval in seconds for checking the status of the batch request and for waiting before retrying a failed request.",
         user_default=300,
         voluntary=True,
         validator=lambda x: x is None or x > 0)
+    initial_pool_interval: Optional[float] = ConfigurableValue(
+        desc="Initial interval in seconds for checking the status of the batch request and for waiting before retrying a failed request. It is doubled after each attempt until it reaches pool_interval.",
+        user_default=2,
+        voluntary=True,
+        validator=lambda x: x is None or x > 0)
     process_requests_interval: Optional[int] = ConfigurableValue(
         desc="Interval in seconds between sending requests when processed synchronously.",
         user_default=1,
         voluntary=True,
         validator=lambda x: x is None or x >= 0)
     concurrency: int = ConfigurableValue(
-        desc="Maximum number of concurrent requests to the API. This is used with async processing.",
+        desc="Maximum number of concurrent requests to the API. This is used with async and synchronous processing.",
         user_default=10, voluntary=True, validator=MinValueIntegerValidator(1)
     )
 
@@ -102,9 +112,24 @@ class APIResponse(BaseModel, ABC):
     """
     Represents the response from an API call.
     """
-    body: dict
+    body: dict | BaseModel  # raw response body, response model from the client is converted to dict when serialized
     structured: bool
 
+    @field_serializer("body")
+    def serialize_body(self, body: dict | BaseModel) -> dict:
+        if isinstance(body, BaseModel):
+            return self.dump_body(body)
+        return body
+
+    def dump_body(self, body: BaseModel) -> dict:
+        """
+        Converts response model from the client to dictionary.
+
+        :param body: Response model.
+        :return: Dictionary representation of the response.
+        """
+        return body.model_dump()
+
     @abstractmethod
     def get_raw_content(self, choice: Optional[int] = None) -> str:
         """
@@ -128,7 +153,9 @@ class APIResponseOpenAI(APIResponse):
         if choice is None:
             choice = 0
 
-        return self.body["choices"][choice]["message"]["content"]
+        if isinstance(self.body, dict):
+            return self.body["choices"][choice]["message"]["content"]
+        return self.body.choices[choice].message.content
 
 
 class APIResponseOllama(APIResponse):
@@ -138,6 +165,7 @@ class APIResponseOllama(APIResponse):
         if choice is not None:
             raise ValueError("Ollama API does not support multiple choices.")
 
+        # works also for the ChatResponse model as it supports item access
         return self.body["message"]["content"]
 
 
@@ -148,7 +176,14 @@ class APIResponseGoogleGenAI(APIResponse):
         if choice is not None:
             raise ValueError("Google GenAI API does not support multiple choices.")
 
-        return self.body["text"]
+        if isinstance(self.body, dict):
+            return self.body["text"]
+        return self.body.text
+
+    def dump_body(self, body: BaseModel) -> dict:
+        response = body.model_dump()
+        response["text"] = body.text
+        return response
 
 
 class APIOutput(BaseModel):
@@ -164,4 +199,53 @@ class APIBase(ABC, APIConfigMixin):
     """
     Base class for API implementations.
     """
-    ...
+
+    @staticmethod
+    def _iter_lines(buffer: bytes | mmap.mmap) -> Generator[bytes, None, None]:
+        """
+        Iterates over non-empty lines of a buffer without splitting the whole buffer in advance.
+
+        :param buffer: Buffer with newline separated content.
+        :return: Generator of lines without the trailing newline.
+        """
+        for _, line in iter_lines(buffer):
+            if line:
+                yield line
+
+    @classmethod
+    def _iter_jsonl_mmap(cls, path_to_file: str) -> Generator[bytes, None, None]:
+        """
+        Iterates over non-empty lines of a JSONL file using memory mapping of the file.
+
+        :param path_to_file: Path to the file.
+        :return: Generator of lines without the trailing newline.
+        """
+        for _, line in iter_file_lines(path_to_file):
+            if line:
+                yield line
+
+    @classmethod
+    def read_request_file(cls, path_to_file: str) -> Iterable[APIRequest]:
+        """
+        Reads requests from a file.
+
+        :param path_to_file: Path to the file with requests.
+        :return: Iterable of requests
+        :raises ValueError: If the file is empty or not found.
+        :raises ValidationError: If the file contains invalid requests.
+        """
+        for line in cls._iter_jsonl_mmap(path_to_file):
+            yield APIRequest.model_validate_json(line)
+
+    def pool_delays(self) -> Generator[float, None, None]:
+        """
+        Generates delays for polling and retrying with exponential backoff and jitter.
+
+        The delay starts at initial_pool_interval and is doubled after each step until it reaches pool_interval.
+
+        :return: Infinite generator of delays in seconds.
+        """
+        delay = min(self.initial_pool_interval, self.pool_interval)
+        while True:
+            yield delay + random.uniform(0, delay * 0.1)
+            delay = min(self.pool_interval, delay * 2)
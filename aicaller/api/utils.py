@@ -1,10 +1,94 @@
+import os
+from functools import lru_cache
 from typing import Optional, Sequence
 
+import orjson
 from google import genai
 from google.genai.types import Part
 
 from aicaller.api.base import APIRequest
 
+HISTORY_ROLES = frozenset({"user", "assistant", "model"})  # roles of messages that are part of conversation history
+
+
+FILE_CACHE_SIZE = 256  # maximal number of cached files
+FILE_CACHE_MAX_FILE_SIZE = 1 << 20  # files larger than this (in bytes) are not cached, so the cache holds at most 256 MiB
+
+
+@lru_cache(maxsize=FILE_CACHE_SIZE)
+def _load_cached_file_bytes(file_path: str, mtime_ns: int) -> bytes:
+    """
+    Loads content of a file. The results are cached as the same files are often repeated across requests.
+
+    :param file_path: Path to the file.
+    :param mtime_ns: Modification time of the file. It is part of the cache key to invalidate changed files.
+    :return: Content of the file.
+    """
+    with open(file_path, "rb") as f:
+        return f.read()
+
+
+def _load_file_bytes(file_path: str) -> bytes:
+    """
+    Loads content of a file. Small files are cached, large files are always read from disk to bound the memory
+    held by the cache.
+
+    :param file_path: Path to the file.
+    :return: Content of the file.
+    """
+    stat = os.stat(file_path)
+    if stat.st_size > FILE_CACHE_MAX_FILE_SIZE:
+        with open(file_path, "rb") as f:
+            return f.read()
+    return _load_cached_file_bytes(file_path, stat.st_mtime_ns)
+
+
+def _create_config(system_instruction: Optional[str], options: dict,
+                   response_json_schema: Optional[dict]) -> Optional[genai.types.GenerateContentConfig]:
+    """
+    Creates Google GenAI GenerateContentConfig.
+
+    The config is intentionally validated (no model_construct) as the options come from user configuration and
+    nested options (e.g. thinking_config) must be converted to their types.
+
+    :param system_instruction: System instruction or None if there is no system message.
+    :param options: Options for the model.
+    :param response_json_schema: JSON schema of the response or None if the response is not structured.
+    :return: genai.types.GenerateContentConfig object or None if there is nothing to configure.
+    """
+    args = {}
+
+    if system_instruction is not None:
+        args["system_instruction"] = genai.types.Content(
+            parts=[genai.types.Part(text=system_instruction)]
+        )
+
+    for k, value in options.items():
+        args[k] = value
+
+    if response_json_schema is not None:
+        args["response_mime_type"] = "application/json"
+        args["response_json_schema"] = response_json_schema
+
+    if len(args) == 0:
+        return None
+
+    return genai.types.GenerateContentConfig(
+        **args
+    )
+
+
+@lru_cache(maxsize=1024)
+def _build_config(key: bytes) -> Optional[genai.types.GenerateContentConfig]:
+    """
+    Builds Google GenAI GenerateContentConfig. The results are cached as the same configuration is usually shared
+    by all requests in a batch, thus the validation runs only once per unique configuration.
+
+    :param key: JSON serialized list of system instruction, options and response JSON schema.
+    :return: genai.types.GenerateContentConfig object or None if there is nothing to configure.
+    """
+    return _create_config(*orjson.loads(key))
+
 
 class GoogleGenAIAPIMixin:
 
@@ -16,20 +100,47 @@ class GoogleGenAIAPIMixin:
         :param part: A string message or non text modality represented as a tuple of (mime_type, file_path).
         :return: A genai.types.Part object.
         """
-        if isinstance(part, str):
+        if type(part) is str:
             return Part.from_text(text=part)
-        elif isinstance(part, (tuple, list)) and len(part) == 2:
-            mime_type, file_path = part
-            with open(file_path, "rb") as f:
-                image_bytes = f.read()
 
-            return Part.from_bytes(
-                data=image_bytes,
-                mime_type=mime_type
-            )
-        else:
+        try:
+            mime_type, file_path = part
+        except (TypeError, ValueError):
             raise ValueError("Invalid part format. Must be a string or a tuple of (mime_type, file_path).")
 
+        image_bytes = _load_file_bytes(file_path)
+
+        return Part.from_bytes(
+            data=image_bytes,
+            mime_type=mime_type
+        )
+
+    @staticmethod
+    def extract_text(response: dict) -> Optional[str]:
+        """
+        Extracts text from a raw Google GenAI response dictionary.
+
+        It works the same way as GenerateContentResponse.text, but without the need to validate the whole response.
+        Thus, it concatenates all text parts (except thoughts) of the first candidate.
+
+        :param response: Raw response dictionary.
+        :return: Concatenated text or None if there is no text part.
+        """
+        candidates = response.get("candidates")
+        if not candidates:
+            return None
+
+        content = candidates[0].get("content")
+        if not content or not content.get("parts"):
+            return None
+
+        text = None
+        for part in content["parts"]:
+            part_text = part.get("text")
+            if isinstance(part_text, str) and part.get("thought") is not True:
+                text = part_text if text is None else text + part_text
+        return text
+
     @classmethod
     def get_conversion_history(cls, request: APIRequest) -> list[genai.types.Content]:
         """
@@ -41,9 +152,9 @@ class GoogleGenAIAPIMixin:
         conversation_history = [
             genai.types.Content(
                 role="model" if message["role"] == "assistant" else message["role"],
-                parts=[cls.convert_part(p) for p in message["parts"]]
+                parts=[Part.from_text(text=p) if type(p) is str else cls.convert_part(p) for p in message["parts"]]
             )
-            for message in request.body.messages if message["role"] in {"user", "assistant", "model"}
+            for message in request.body.messages if message["role"] in HISTORY_ROLES
         ]
         return conversation_history
 
@@ -55,28 +166,21 @@ class GoogleGenAIAPIMixin:
         :param request: APIRequest object.
         :return: genai.types.GenerateContentConfig object.
         """
-        args = {}
-
-        # get system message
+        system_instruction = None
         for message in request.body.messages:
             if message["role"] == "system":
                 if len(message["parts"]) > 1:
                     raise ValueError("Google GenAI API supports only single-part system messages.")
-                args["system_instruction"] = genai.types.Content(
-                    parts=[genai.types.Part(text=message["parts"][0])]
-                )
+                system_instruction = message["parts"][0]
                 break
 
-        for key, value in request.body.options.items():
-            args[key] = value
-
-        if request.body.format is not None:
-            args["response_mime_type"] = "application/json"
-            args["response_json_schema"] = request.body.format if isinstance(request.body.format, dict) else request.body.format.model_json_schema()
+        response_json_schema = request.body.format
+        if response_json_schema is not None and not isinstance(response_json_schema, dict):
+            response_json_schema = response_json_schema.model_json_schema()
 
-        if len(args) == 0:
-            return None
-
-        return genai.types.GenerateContentConfig(
-            **args
-        )
+        try:
+            key = orjson.dumps([system_instruction, request.body.options, response_json_schema])
+        except TypeError:
+            # options with values that are not JSON serializable (e.g. genai types or callable tools) are not cached
+            return _create_config(system_instruction, request.body.options, response_json_schema)
+        return _build_config(key)
@@ -1,16 +1,23 @@
 import importlib
 from abc import abstractmethod, ABC
-from typing import Generator, Optional, Type
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from math import ceil
+from typing import Generator, Optional, Type, BinaryIO
 
-import jinja2
+import orjson
 from classconfig import ConfigurableValue, ConfigurableMixin, ConfigurableSubclassFactory, RelativePathTransformer
 from classconfig.validators import AnyValidator, BoolValidator, StringValidator, IsNoneValidator
+from classconfig.validators import MinValueIntegerValidator
+from datasets import Dataset, IterableDataset
 from pydantic import BaseModel
 
-from aicaller.api.base import APIRequest, GoogleGenAIAPIRequestBody
+from aicaller.api.base import APIRequest, APIRequestBody, GoogleGenAIAPIRequestBody
 from aicaller.api.base import OpenAIAPIRequestBody, OllamaAPIRequestBody
 from aicaller.loader import Loader
 from aicaller.sample_assembler import APISampleAssembler
+from aicaller.template import compile_template
 from aicaller.modules import load_module
 
 
@@ -21,6 +28,12 @@ class Convertor(ConfigurableMixin, ABC):
     loader: Loader = ConfigurableSubclassFactory(Loader, "Loader for the data.")
     method: str = ConfigurableValue("HTTP method for the request", user_default="POST", voluntary=True, validator=lambda x: x in ["POST"])
     url: str = ConfigurableValue("URL for the request", user_default="/v1/chat/completions", voluntary=True)
+    workers: int = ConfigurableValue(
+        "Number of processes used for conversion. Values greater than 1 convert contiguous shards of the dataset in parallel. Streamed datasets and samples with few-shot examples are always converted in a single process, so the sampled few-shot examples are reproducible.",
+        user_default=1, voluntary=True, validator=MinValueIntegerValidator(1))
+
+    SHARD_SIZE = 1024  # maximal number of samples converted by a worker at once
+    WRITE_BUFFER_SIZE = 1 << 20  # bytes
 
     @abstractmethod
     def convert(self, p: Optional[str] = None) -> Generator[str, None, None]:
@@ -32,6 +45,105 @@ class Convertor(ConfigurableMixin, ABC):
         """
         ...
 
+    def convert_to_file(self, out: str | BinaryIO, p: Optional[str] = None):
+        """
+        Converts data and writes the API request lines directly to a file.
+
+        It is cheaper than writing lines obtained from convert as the requests are serialized directly to bytes.
+
+        :param out: Path to the output file or binary file-like object.
+        :param p: Path to data. If not provided, the path from the configuration is used.
+        """
+        with (open(out, "wb", buffering=self.WRITE_BUFFER_SIZE) if isinstance(out, str) else nullcontext(out)) as f:
+            write = f.write
+            for line in self.convert_dataset(self.loader.load(p)):
+                write(line)
+                write(b"\n")
+
+    def convert_dataset(self, dataset: Dataset | IterableDataset) -> Generator[bytes, None, None]:
+        """
+        Converts loaded dataset.
+
+        When more workers are configured, the dataset is split into contiguous shards that are converted in
+        separate processes. The requests are still generated in the original order.
+        Only a bounded number of shards is converted in advance, so the memory doesn't grow with the dataset size.
+
+        Few-shot examples are sampled sequentially from a single random generator, thus datasets are converted in
+        a single process when the few-shot sampler is used.
+
+        :param dataset: Loaded dataset.
+        :return: API request lines encoded in UTF-8
+        """
+        if self.workers <= 1 or not isinstance(dataset, Dataset) or self.sample_assembler.few_shot_sampler is not None:
+            yield from self.serialize_requests(dataset)
+            return
+
+        shard_size = max(1, min(self.SHARD_SIZE, ceil(len(dataset) / self.workers)))
+        shards = (range(start, min(start + shard_size, len(dataset))) for start in range(0, len(dataset), shard_size))
+        max_in_flight = 2 * self.workers
+        with ProcessPoolExecutor(max_workers=self.workers, initializer=init_conversion_worker,
+                                 initargs=(self, dataset)) as executor:
+            in_flight = deque()
+            for shard in shards:
+                if len(in_flight) >= max_in_flight:
+                    yield from in_flight.popleft().result()
+                in_flight.append(executor.submit(convert_shard, shard))
+
+            while in_flight:
+                yield from in_flight.popleft().result()
+
+    def serialize_requests(self, dataset: Dataset | IterableDataset, select: Optional[range] = None) -> Generator[bytes, None, None]:
+        """
+        Assembles samples and serializes them to API requests.
+
+        :param dataset: Loaded dataset.
+        :param select: Contiguous range of samples to convert. Else all samples are converted.
+        :return: API request lines encoded in UTF-8
+        """
+        custom_id_fields = {}  # reused for all samples
+
+        # bound once as they are called for every sample
+        render_custom_id = self.render_custom_id
+        dumps = orjson.dumps
+        prefix, middle, suffix = self._request_prefix, self._request_middle, self._request_suffix
+
+        samples = self.sample_assembler.assemble(dataset, select)
+        for i, (sample, sample_ids) in enumerate(samples, start=0 if select is None else select.start):
+            if isinstance(sample, str):
+                sample = [{"role": "user", "content": sample}]
+
+            custom_id_fields.clear()
+            custom_id_fields.update(sample_ids)
+            custom_id_fields["index"] = i
+            yield prefix + dumps(render_custom_id(custom_id_fields)) + middle + dumps(sample) + suffix
+
+    @staticmethod
+    def split_request_template(body: APIRequestBody) -> tuple[bytes, bytes, bytes]:
+        """
+        Splits serialized request without messages into parts that precede custom id, precede messages and
+        follow messages.
+
+        Everything except the custom id and messages is the same for all requests, so the request can be serialized
+        in advance and only the custom id and messages are serialized for each sample.
+        The custom id is not rendered here as the id format may use fields that are provided only by the assembler.
+
+        :param body: Body of the request with empty messages.
+        :return: Parts of the serialized request encoded in UTF-8.
+        """
+        template = APIRequest(custom_id="", body=body).model_dump_json().encode()
+        template = template[template.index(b',"method":'):]
+        before_messages, after_messages = template.split(b'"messages":[]', 1)
+        return b'{"custom_id":', before_messages + b'"messages":', after_messages
+
+    def render_custom_id(self, custom_id_fields: dict) -> str:
+        """
+        Renders custom id.
+
+        :param custom_id_fields: Fields for custom id.
+        :return: Custom id.
+        """
+        return self.jinja_id_template.render(custom_id_fields)
+
     @staticmethod
     def load_response_class(path_to_module: str) -> Type[BaseModel]:
         """
@@ -48,6 +160,32 @@ class Convertor(ConfigurableMixin, ABC):
         return response_class
 
 
+_worker_convertor: Optional[Convertor] = None
+_worker_dataset: Optional[Dataset] = None
+
+
+def init_conversion_worker(convertor: Convertor, dataset: Dataset):
+    """
+    Initializes worker process for parallel conversion.
+
+    :param convertor: Convertor used for conversion.
+    :param dataset: Dataset that is converted.
+    """
+    global _worker_convertor, _worker_dataset
+    _worker_convertor = convertor
+    _worker_dataset = dataset
+
+
+def convert_shard(select: range) -> list[bytes]:
+    """
+    Converts shard of the dataset in worker process.
+
+    :param select: Contiguous range of samples to convert.
+    :return: API request lines encoded in UTF-8
+    """
+    return list(_worker_convertor.serialize_requests(_worker_dataset, select))
+
+
 class ToOpenAIBatchFile(Convertor):
     """
     Base class for conversion of data to OpenAI batch file.
@@ -75,8 +213,7 @@ class ToOpenAIBatchFile(Convertor):
     )
 
     def __post_init__(self):
-        self.jinja = jinja2.Environment()
-        self.jinja_id_template = self.jinja.from_string(self.id_format)
+        self.jinja_id_template = compile_template(self.id_format)
 
         if isinstance(self.response_format_path, str):
             resp = self.load_response_class(self.response_format_path)
@@ -88,19 +225,22 @@ class ToOpenAIBatchFile(Convertor):
                 }
             }
 
-    def build_request(self, sample: list[dict], custom_id_fields: dict) -> APIRequest:
+        self._request_prefix, self._request_middle, self._request_suffix = self.split_request_template(
+            self.build_body([])
+        )
+
+    def build_body(self, sample: list[dict]) -> OpenAIAPIRequestBody:
         """
-        Builds a request for the API.
+        Builds a body of the request for the API.
 
         :param sample: Sample with messages.
-        :param custom_id_fields: Fields for custom id.
-        :return: Request for the API.
+        :return: Body of the request.
         """
 
         if isinstance(sample, str):
             sample = [{"role": "user", "content": sample}]
 
-        body = OpenAIAPIRequestBody(
+        return OpenAIAPIRequestBody(
             model=self.model,
             messages=sample,
             temperature=self.temperature,
@@ -108,9 +248,18 @@ class ToOpenAIBatchFile(Convertor):
             max_completion_tokens=self.max_completion_tokens,
             response_format=self.response_format
         )
+
+    def build_request(self, sample: list[dict], custom_id_fields: dict) -> APIRequest:
+        """
+        Builds a request for the API.
+
+        :param sample: Sample with messages.
+        :param custom_id_fields: Fields for custom id.
+        :return: Request for the API.
+        """
         request = APIRequest(
-            custom_id=self.jinja_id_template.render(custom_id_fields),
-            body=body
+            custom_id=self.render_custom_id(custom_id_fields),
+            body=self.build_body(sample)
         )
         return request
 
@@ -121,13 +270,8 @@ class ToOpenAIBatchFile(Convertor):
         :param p: Path to data
         :return: OpenAI batch file lines
         """
-        dataset = self.loader.load(p)
-        for i, (sample, sample_ids) in enumerate(self.sample_assembler.assemble(dataset)):
-            request = self.build_request(
-                sample=sample,
-                custom_id_fields={**sample_ids, "index": i}
-            )
-            yield request.model_dump_json()
+        for line in self.convert_dataset(self.loader.load(p)):
+            yield line.decode()
 
 
 class ToOllamaBatchFile(Convertor):
@@ -162,33 +306,43 @@ class ToOllamaBatchFile(Convertor):
     )
 
     def __post_init__(self):
-        self.jinja = jinja2.Environment()
-        self.jinja_id_template = self.jinja.from_string(self.id_format)
+        self.jinja_id_template = compile_template(self.id_format)
         if isinstance(self.format_path, str):
             self.format = self.load_response_class(self.format_path).model_json_schema()
+        self._request_prefix, self._request_middle, self._request_suffix = self.split_request_template(
+            self.build_body([])
+        )
 
-    def build_request(self, sample: list[dict], custom_id_fields: dict) -> APIRequest:
+    def build_body(self, sample: list[dict]) -> OllamaAPIRequestBody:
         """
-        Builds a request for the API.
+        Builds a body of the request for the API.
 
         :param sample: Sample with messages.
-        :param custom_id_fields: Fields for custom id.
-        :return: Request for the API.
+        :return: Body of the request.
         """
 
         if isinstance(sample, str):
             sample = [{"role": "user", "content": sample}]
 
-        body = OllamaAPIRequestBody(
+        return OllamaAPIRequestBody(
             model=self.model,
             messages=sample,
             options=self.options,
             format=self.format,
             think=self.think
         )
+
+    def build_request(self, sample: list[dict], custom_id_fields: dict) -> APIRequest:
+        """
+        Builds a request for the API.
+
+        :param sample: Sample with messages.
+        :param custom_id_fields: Fields for custom id.
+        :return: Request for the API.
+        """
         request = APIRequest(
-            custom_id=self.jinja_id_template.render(custom_id_fields),
-            body=body
+            custom_id=self.render_custom_id(custom_id_fields),
+            body=self.build_body(sample)
         )
 
         return request
@@ -200,14 +354,8 @@ class ToOllamaBatchFile(Convertor):
         :param p: Path to data
         :return: OpenAI batch file lines
         """
-        dataset = self.loader.load(p)
-
-        for i, (sample, sample_ids) in enumerate(self.sample_assembler.assemble(dataset)):
-            request = self.build_request(
-                sample=sample,
-                custom_id_fields={**sample_ids, "index": i}
-            )
-            yield request.model_dump_json()
+        for line in self.convert_dataset(self.loader.load(p)):
+            yield line.decode()
 
 
 class ToGoogleGenAIBatchFile(Convertor):
@@ -236,32 +384,42 @@ class ToGoogleGenAIBatchFile(Convertor):
     )
 
     def __post_init__(self):
-        self.jinja = jinja2.Environment()
-        self.jinja_id_template = self.jinja.from_string(self.id_format)
+        self.jinja_id_template = compile_template(self.id_format)
         if isinstance(self.format_path, str):
             self.format = self.load_response_class(self.format_path).model_json_schema()
+        self._request_prefix, self._request_middle, self._request_suffix = self.split_request_template(
+            self.build_body([])
+        )
 
-    def build_request(self, sample: list[dict], custom_id_fields: dict) -> APIRequest:
+    def build_body(self, sample: list[dict]) -> GoogleGenAIAPIRequestBody:
         """
-        Builds a request for the API.
+        Builds a body of the request for the API.
 
         :param sample: Sample with messages.
-        :param custom_id_fields: Fields for custom id.
-        :return: Request for the API.
+        :return: Body of the request.
         """
 
         if isinstance(sample, str):
             sample = [{"role": "user", "content": sample}]
 
-        body = GoogleGenAIAPIRequestBody(
+        return GoogleGenAIAPIRequestBody(
             model=self.model,
             messages=sample,
             options=self.options,
             format=self.format
         )
+
+    def build_request(self, sample: list[dict], custom_id_fields: dict) -> APIRequest:
+        """
+        Builds a request for the API.
+
+        :param sample: Sample with messages.
+        :param custom_id_fields: Fields for custom id.
+        :return: Request for the API.
+        """
         request = APIRequest(
-            custom_id=self.jinja_id_template.render(custom_id_fields),
-            body=body
+            custom_id=self.render_custom_id(custom_id_fields),
+            body=self.build_body(sample)
         )
 
         return request
@@ -273,11 +431,5 @@ class ToGoogleGenAIBatchFile(Convertor):
         :param p: Path to data
         :return: OpenAI batch file lines
         """
-        dataset = self.loader.load(p)
-
-        for i, (sample, sample_ids) in enumerate(self.sample_assembler.assemble(dataset)):
-            request = self.build_request(
-                sample=sample,
-                custom_id_fields={**sample_ids, "index": i}
-            )
-            yield request.model_dump_json()
+        for line in self.convert_dataset(self.loader.load(p)):
+            yield line.decode()
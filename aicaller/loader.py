@@ -3,7 +3,7 @@ from typing import Optional
 
 from classconfig import ConfigurableMixin, ConfigurableValue, RelativePathTransformer
 from classconfig.validators import StringValidator, AnyValidator, IsNoneValidator
-from datasets import Dataset, load_dataset, load_from_disk
+from datasets import Dataset, IterableDataset, load_dataset, load_from_disk
 
 
 class Loader(ABC, ConfigurableMixin):
@@ -65,11 +65,16 @@ class HFLoader(Loader):
         "Uses the load_from_disk method instead of load_dataset. This is useful for loading already processed datasets that are saved to disk.",
         user_default=False
     )
+    streaming: bool = ConfigurableValue(
+        "Streams the dataset instead of downloading and preparing it as a whole. Samples are loaded lazily during iteration, so the dataset doesn't need to fit on disk or in memory. It is not used with load_from_disk and it can't be used for few-shot sampling as it needs random access.",
+        user_default=False,
+        voluntary=True
+    )
 
-    def _load(self, p: str) -> Dataset:
+    def _load(self, p: str) -> Dataset | IterableDataset:
         if self.load_from_disk:
             return load_from_disk(p)
-        return load_dataset(p, self.config, split=self.split)
+        return load_dataset(p, self.config, split=self.split, streaming=self.streaming)
 
 
 class HFImageLoader(Loader):
@@ -1,5 +1,6 @@
 from abc import ABC
 from abc import abstractmethod
+from functools import lru_cache
 from pathlib import Path
 from typing import Generator, Union, Optional, Any, Sequence
 
@@ -11,6 +12,25 @@ from aicaller.few_shot_sampler import FewShotSampler
 from aicaller.template import StringTemplate, Template
 
 
+ITER_BATCH_SIZE = 1024
+
+
+def iter_rows(dataset: Dataset, batch_size: int = ITER_BATCH_SIZE) -> Generator[dict[str, Any], None, None]:
+    """
+    Iterates dataset rows.
+
+    The dataset is read in batches as it is much faster than reading it row by row.
+
+    :param dataset: Dataset to iterate.
+    :param batch_size: Number of rows read at once.
+    :return: Generator of rows.
+    """
+    for batch in dataset.iter(batch_size=batch_size):
+        columns = list(batch.keys())
+        for values in zip(*batch.values()):
+            yield dict(zip(columns, values))
+
+
 class APISampleAssembler(ABC):
     """
     Base class for assemblers that are used to create samples for API requests.
@@ -82,6 +102,8 @@ class TextDatasetAssembler(TemplateBasedAssembler):
     direct: Optional[str] = ConfigurableValue("Name of jsonl field that contains the sample. In that case, the template is not used.",
                                                 voluntary=True, validator=AnyValidator([IsNoneValidator(), StringValidator()]))
 
+    RENDER_CACHE_SIZE = 4096  # maximal number of cached rendered samples
+
     def __init__(self, input_template: Template, few_shot_sampler: Optional[FewShotSampler] = None,
                  id_fields: Optional[Sequence[str]] = None, direct: Optional[str] = None):
         """
@@ -110,7 +132,29 @@ class TextDatasetAssembler(TemplateBasedAssembler):
                     }
         """
 
-        for line_number, sample in enumerate(dataset):
+        first_line_number = 0
+        if isinstance(select, range) and select.step == 1 and isinstance(dataset, Dataset):
+            # contiguous selection doesn't need to read the whole dataset
+            dataset = dataset.select(select)
+            first_line_number = select.start
+            select = None
+
+        columns = self.used_columns(dataset)
+        if columns:
+            dataset = dataset.select_columns(columns)
+
+        render = self.input_template.render  # bound once as it is called for every sample
+
+        # samples with the same values of template variables are rendered only once
+        template_columns = None
+        if columns and not self.direct and self.few_shot_sampler is None:
+            variables = self.input_template.variables()
+            template_columns = [c for c in columns if c in variables]
+            cached_render = lru_cache(maxsize=self.RENDER_CACHE_SIZE)(
+                lambda values: render(dict(zip(template_columns, values)))
+            )
+
+        for line_number, sample in enumerate(iter_rows(dataset), start=first_line_number):
             sample_ids = {"line_number": line_number}
             if self.id_fields is not None:
                 for field in self.id_fields:
@@ -122,10 +166,40 @@ class TextDatasetAssembler(TemplateBasedAssembler):
                 sample = sample[self.direct]
             else:
                 self.add_few_shot(sample)
-                sample = self.input_template.render(sample)
+                if template_columns is None:
+                    sample = render(sample)
+                else:
+                    try:
+                        sample = cached_render(tuple([sample[c] for c in template_columns]))
+                    except TypeError:
+                        # unhashable values (e.g., lists) can't be cached
+                        template_columns = None
+                        sample = render(sample)
 
             yield sample, sample_ids
 
+    def used_columns(self, dataset: Dataset) -> Optional[list[str]]:
+        """
+        Obtains dataset columns that are needed for assembly of samples.
+
+        :param dataset: Dataset for assembly of samples.
+        :return: Needed columns or None if they are unknown.
+        """
+        if dataset.column_names is None:
+            return None
+
+        if self.direct:
+            needed = {self.direct}
+        else:
+            needed = self.input_template.variables()
+            if needed is None:
+                return None
+
+        if self.id_fields is not None:
+            needed = needed.union(self.id_fields)
+
+        return [c for c in dataset.column_names if c in needed]
+
 
 class ImageDatasetAssembler(TemplateBasedAssembler):
     def __init__(self, input_template: Template, few_shot_sampler: Optional[FewShotSampler] = None,
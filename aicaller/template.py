@@ -1,9 +1,12 @@
 import json
+import re
 from abc import ABC, abstractmethod
 from enum import Enum
-from typing import Any, Optional
+from functools import lru_cache
+from typing import Any, Optional, Iterable
 
 import jinja2
+from jinja2 import meta
 from classconfig import ConfigurableValue, ListOfConfigurableSubclassFactoryAttributes, ConfigurableSubclassFactory
 from classconfig.transforms import EnumTransformer
 from classconfig.validators import ListOfTypesValidator, StringValidator, AnyValidator, IsNoneValidator
@@ -23,12 +26,136 @@ class Jinja2EnvironmentSingletonFactory:
 
     def __init__(self):
         if not self.jinja_env:
-            self.jinja_env = jinja2.Environment()
+            jinja_env = jinja2.Environment()
             # default tojson doesn't allow to use all the arguments of json.dumps
-            self.jinja_env.filters["tojson"] = json.dumps
-            self.jinja_env.filters["fromjson"] = json.loads
-            self.jinja_env.filters["filter_dict"] = lambda d, keys: {k: v for k, v in d.items() if k in keys}
-            self.jinja_env.filters["model_dump_json"] = lambda obj: obj.model_dump_json()
+            jinja_env.filters["tojson"] = json.dumps
+            jinja_env.filters["fromjson"] = json.loads
+            jinja_env.filters["filter_dict"] = lambda d, keys: {k: v for k, v in d.items() if k in keys}
+            jinja_env.filters["model_dump_json"] = lambda obj: obj.model_dump_json()
+            jinja_env.template_class = PicklableTemplate
+            Jinja2EnvironmentSingletonFactory.jinja_env = jinja_env
+
+
+class PicklableTemplate(jinja2.Template):
+    """
+    Jinja2 template that can be pickled (e.g., to be sent to a worker process).
+    It is compiled again from its source when unpickled.
+    """
+
+    source: str
+
+    def __reduce__(self):
+        return compile_jinja_template, (self.source,)
+
+
+JINJA2_RESERVED_NAMES = frozenset({"true", "false", "none", "True", "False", "None", "self"})
+
+
+def to_format_string(source: str) -> Optional[str]:
+    """
+    Converts Jinja2 template to str.format format string if the template only substitutes variables
+    (e.g. Hello {{name}}!).
+
+    :param source: template source
+    :return: format string or None if the template uses other Jinja2 features
+    """
+    # the same newline handling as Jinja2 does
+    lines = re.split(r"\r\n|\r|\n", source)
+    if lines[-1] == "":
+        del lines[-1]
+    source = "\n".join(lines)
+
+    parts = re.split(r"\{\{\s*([A-Za-z_]\w*)\s*\}\}", source)
+    format_string = []
+    for i, part in enumerate(parts):
+        if i % 2:
+            if part in JINJA2_RESERVED_NAMES:
+                return None
+            format_string.append("{" + part + "}")
+        elif "{{" in part or "{%" in part or "{#" in part:
+            return None
+        else:
+            format_string.append(part.replace("{", "{{").replace("}", "}}"))
+    return "".join(format_string)
+
+
+class FormatStringRenderer:
+    """
+    Renders Jinja2 template that only substitutes variables using str.format_map, which is much cheaper than
+    rendering it with Jinja2.
+    """
+
+    def __init__(self, format_string: str, jinja_template: PicklableTemplate):
+        """
+        :param format_string: format string equivalent to the template
+        :param jinja_template: compiled template, used when some of the variables are missing
+        """
+        self.format_string = format_string
+        self.jinja_template = jinja_template
+
+    def render(self, data: dict[str, Any]) -> str:
+        try:
+            return self.format_string.format_map(data)
+        except KeyError:
+            # undefined variables are rendered as empty strings by Jinja2
+            return self.jinja_template.render(data)
+
+
+@lru_cache(maxsize=128)
+def compile_jinja_template(source: str) -> PicklableTemplate:
+    """
+    Compiles Jinja2 template in the shared environment.
+
+    :param source: template source
+    :return: compiled template
+    """
+    jinja_template = Jinja2EnvironmentSingletonFactory().jinja_env.from_string(source)
+    jinja_template.source = source
+    return jinja_template
+
+
+@lru_cache(maxsize=128)
+def compile_template(source: str) -> PicklableTemplate | FormatStringRenderer:
+    """
+    Compiles template.
+
+    Compiled templates are cached by their source, so the same template used by multiple instances
+    is parsed and compiled only once. Templates that only substitute variables are rendered without Jinja2.
+
+    :param source: template source
+    :return: compiled template
+    """
+    jinja_template = compile_jinja_template(source)
+    format_string = to_format_string(source)
+    if format_string is None:
+        return jinja_template
+    return FormatStringRenderer(format_string, jinja_template)
+
+
+@lru_cache(maxsize=128)
+def template_variables(source: str) -> frozenset[str]:
+    """
+    Obtains names of variables that are used by Jinja2 template but not defined in it.
+
+    :param source: template source
+    :return: names of used variables
+    """
+    return frozenset(meta.find_undeclared_variables(Jinja2EnvironmentSingletonFactory().jinja_env.parse(source)))
+
+
+def union_variables(variables: Iterable[Optional[frozenset[str]]]) -> Optional[frozenset[str]]:
+    """
+    Union of used variables.
+
+    :param variables: used variables, None means that the used variables are unknown
+    :return: union of used variables or None if any of them is unknown
+    """
+    res = set()
+    for v in variables:
+        if v is None:
+            return None
+        res |= v
+    return frozenset(res)
 
 
 class Template(ABC):
@@ -46,6 +173,14 @@ class Template(ABC):
         """
         ...
 
+    def variables(self) -> Optional[frozenset[str]]:
+        """
+        Names of data fields that are used by the template.
+
+        :return: names of used fields or None if they are unknown
+        """
+        return None
+
 
 class StringTemplate(Template):
     """
@@ -56,12 +191,14 @@ class StringTemplate(Template):
 
     def __init__(self, template: str):
         self.template = template
-        self.jinja = Jinja2EnvironmentSingletonFactory().jinja_env
-        self.jinja_template = self.jinja.from_string(template)
+        self.jinja_template = compile_template(template)
 
     def render(self, data: dict[str, Any]) -> str:
         return self.jinja_template.render(data)
 
+    def variables(self) -> Optional[frozenset[str]]:
+        return template_variables(self.template)
+
 
 class SegmentedStringTemplate(Template):
     """
@@ -74,9 +211,8 @@ class SegmentedStringTemplate(Template):
 
     def __init__(self, template: dict[str, str]):
         self.template = template
-        self.jinja = Jinja2EnvironmentSingletonFactory().jinja_env
         self.jinja_template = {
-            k: self.jinja.from_string(v) for k, v in template.items()
+            k: compile_template(v) for k, v in template.items()
         }
 
     def render(self, data: dict[str, Any]) -> SegmentedString:
@@ -85,6 +221,9 @@ class SegmentedStringTemplate(Template):
             self.jinja_template.keys()
         )
 
+    def variables(self) -> Optional[frozenset[str]]:
+        return union_variables(template_variables(t) for t in self.template.values())
+
 
 class MessageBuilder(ABC):
     """
@@ -101,6 +240,14 @@ class MessageBuilder(ABC):
         """
         ...
 
+    def variables(self) -> Optional[frozenset[str]]:
+        """
+        Names of data fields that are used by the message.
+
+        :return: names of used fields or None if they are unknown
+        """
+        return None
+
 
 class OpenAIMessageBuilder(MessageBuilder):
     """
@@ -114,8 +261,7 @@ class OpenAIMessageBuilder(MessageBuilder):
     def __init__(self, role: str, content: str):
         self.role = role
         self.content = content
-        self.jinja = Jinja2EnvironmentSingletonFactory().jinja_env
-        self.jinja_template = self.jinja.from_string(content)
+        self.jinja_template = compile_template(content)
 
     def render(self, data: dict[str, Any]) -> dict[str, Any]:
         return {
@@ -123,6 +269,9 @@ class OpenAIMessageBuilder(MessageBuilder):
             "content": self.jinja_template.render(data)
         }
 
+    def variables(self) -> Optional[frozenset[str]]:
+        return template_variables(self.content)
+
 
 class OpenAIContentType(ABC):
     """
@@ -139,6 +288,14 @@ class OpenAIContentType(ABC):
         """
         ...
 
+    def variables(self) -> Optional[frozenset[str]]:
+        """
+        Names of data fields that are used by the content.
+
+        :return: names of used fields or None if they are unknown
+        """
+        return None
+
 
 class OpenAITextContent(OpenAIContentType):
     """
@@ -149,8 +306,7 @@ class OpenAITextContent(OpenAIContentType):
 
     def __init__(self, text: str):
         self.text = text
-        self.jinja = Jinja2EnvironmentSingletonFactory().jinja_env
-        self.jinja_template = self.jinja.from_string(text)
+        self.jinja_template = compile_template(text)
 
     def render(self, data: dict[str, Any]) -> dict[str, str]:
         return {
@@ -158,6 +314,9 @@ class OpenAITextContent(OpenAIContentType):
             "text": self.jinja_template.render(data)
         }
 
+    def variables(self) -> Optional[frozenset[str]]:
+        return template_variables(self.text)
+
 
 class OpenAIImageDetail(Enum):
     """
@@ -184,8 +343,7 @@ class OpenAIImageContent(OpenAIContentType):
     def __init__(self, url: str, detail: OpenAIImageDetail = OpenAIImageDetail.AUTO):
         self.url = url
         self.detail = detail
-        self.jinja = Jinja2EnvironmentSingletonFactory().jinja_env
-        self.jinja_template = self.jinja.from_string(url)
+        self.jinja_template = compile_template(url)
 
     def render(self, data: dict[str, Any]) -> dict[str, str]:
         image_path = self.jinja_template.render(data)
@@ -220,6 +378,9 @@ class OpenAIImageContent(OpenAIContentType):
                 }
             }
 
+    def variables(self) -> Optional[frozenset[str]]:
+        return template_variables(self.url)
+
 
 class OpenAIMultiModalMessageBuilder(MessageBuilder):
     """
@@ -243,6 +404,9 @@ class OpenAIMultiModalMessageBuilder(MessageBuilder):
             "content": [content.render(data) for content in self.content]
         }
 
+    def variables(self) -> Optional[frozenset[str]]:
+        return union_variables(content.variables() for content in self.content)
+
 
 class OllamaMessageBuilder(MessageBuilder):
     """
@@ -261,10 +425,9 @@ class OllamaMessageBuilder(MessageBuilder):
         self.content = content
         self.images = images
 
-        self.jinja = Jinja2EnvironmentSingletonFactory().jinja_env
-        self.jinja_template = self.jinja.from_string(content)
+        self.jinja_template = compile_template(content)
         if images:
-            self.jinja_images = [self.jinja.from_string(image) for image in images]
+            self.jinja_images = [compile_template(image) for image in images]
 
     def render(self, data: dict[str, Any]) -> dict[str, Any]:
         message = {
@@ -275,6 +438,9 @@ class OllamaMessageBuilder(MessageBuilder):
             message["images"] = [jinja_image.render(data) for jinja_image in self.jinja_images]
         return message
 
+    def variables(self) -> Optional[frozenset[str]]:
+        return union_variables(template_variables(t) for t in [self.content] + (self.images or []))
+
 
 class GoogleGenAIMessageBuilder(MessageBuilder):
     """
@@ -296,10 +462,9 @@ class GoogleGenAIMessageBuilder(MessageBuilder):
         self.content = content
         self.images = images
 
-        self.jinja = Jinja2EnvironmentSingletonFactory().jinja_env
-        self.jinja_template = self.jinja.from_string(content)
+        self.jinja_template = compile_template(content)
         if images:
-            self.jinja_images = [self.jinja.from_string(image) for image in images]
+            self.jinja_images = [compile_template(image) for image in images]
 
     def render(self, data: dict[str, Any]) -> dict[str, Any]:
         # GoogleGenAI expects 'parts' array with text and optional images
@@ -333,6 +498,9 @@ class GoogleGenAIMessageBuilder(MessageBuilder):
 
         return message
 
+    def variables(self) -> Optional[frozenset[str]]:
+        return union_variables(template_variables(t) for t in [self.content] + (self.images or []))
+
 
 class MessagesTemplate(Template):
     """
@@ -350,3 +518,6 @@ class MessagesTemplate(Template):
     def render(self, data: dict[str, Any]) -> list[dict[str, Any]]:
         return [message.render(data) for message in self.messages]
 
+    def variables(self) -> Optional[frozenset[str]]:
+        return union_variables(message.variables() for message in self.messages)
+
@@ -5,17 +5,51 @@ Created on 02.12.24
 :author:     Martin Dočekal
 """
 import base64
-import json
+import mmap
+import os
 from io import BytesIO
 from json import JSONDecodeError
 from math import ceil
+from typing import Generator
 
 import json_repair
+import orjson
 import requests
 import tiktoken
 from PIL import Image
 
 
+def iter_lines(buffer: bytes | mmap.mmap) -> Generator[tuple[int, bytes], None, None]:
+    """
+    Iterates over lines of a buffer without splitting the whole buffer in advance.
+
+    :param buffer: Buffer with newline separated content.
+    :return: Generator of line offsets and lines without the trailing newline. Empty lines are included.
+    """
+    pos = 0
+    end = len(buffer)
+    while pos < end:
+        nl = buffer.find(b"\n", pos)
+        if nl == -1:
+            nl = end
+        yield pos, buffer[pos:nl]
+        pos = nl + 1
+
+
+def iter_file_lines(path_to_file: str) -> Generator[tuple[int, bytes], None, None]:
+    """
+    Iterates over lines of a file using memory mapping of the file.
+
+    :param path_to_file: Path to the file.
+    :return: Generator of line offsets and lines without the trailing newline. Empty lines are included.
+    """
+    with open(path_to_file, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            yield from iter_lines(mm)
+
+
 def jsonl_field_value_2_file_offset_mapping(file: str, field: str) -> dict:
     """
     Creates mapping of field value to file line offset.
@@ -29,12 +63,25 @@ def jsonl_field_value_2_file_offset_mapping(file: str, field: str) -> dict:
 
     mapping = {}
 
-    with open(file, "r") as f:
-        offset = 0
-        while line := f.readline():
-            data = json.loads(line)
-            mapping[data[field]] = offset
-            offset = f.tell()
+    # when the field is the first one and its value is a string without escapes, which is the common case for ids,
+    # the value is read directly without parsing the whole line
+    first_field_prefix = b"{" + orjson.dumps(field) + b':"'
+    prefix_len = len(first_field_prefix)
+
+    for offset, line in iter_file_lines(file):
+        if not line:
+            continue
+
+        value_end = -1
+        if line.startswith(first_field_prefix):
+            value_end = line.find(b'"', prefix_len)
+            if value_end != -1 and line.find(b"\\", prefix_len, value_end) != -1:
+                value_end = -1
+
+        if value_end == -1:
+            mapping[orjson.loads(line)[field]] = offset
+        else:
+            mapping[line[prefix_len:value_end].decode("utf-8")] = offset
 
     return mapping
 
@@ -49,9 +96,12 @@ def read_potentially_malformed_json_result(j: str, should_be_dict: bool = True)
     :raises JSONDecodeError: If the JSON is not parsable.
     """
 
-    r = json_repair.loads(j)
+    try:
+        r = orjson.loads(j)
+    except orjson.JSONDecodeError:
+        r = json_repair.loads(j)
     if should_be_dict and not isinstance(r, dict):
-        if not isinstance(r[0], dict):
+        if not isinstance(r, list) or not r or not isinstance(r[0], dict):
             raise JSONDecodeError("Could not parse JSON.", j, 0)
         r = r[0]
     return r
@@ -66,11 +116,18 @@ def obtain_base64_image(path: str) -> str:
     """
 
     with open(path, "rb") as f:
-        return base64.b64encode(f.read()).decode("utf-8")
+        if os.fstat(f.fileno()).st_size == 0:
+            return ""
+        # encoding directly from the mapped file avoids holding a separate copy of the raw image in memory
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return base64.b64encode(mm).decode("ascii")
+
+
+URL_PREFIXES = ("http://", "https://")
 
 
 def is_url(url: str) -> bool:
-    return url.startswith("http://") or url.startswith("https://")
+    return url.startswith(URL_PREFIXES)
 
 
 def detect_image_format(path: str) -> str:
@@ -80,6 +137,19 @@ def detect_image_format(path: str) -> str:
     :param path: path to the image
     :return: image format
     """
+    with open(path, "rb") as f:
+        header = f.read(12)
+
+    # common formats are recognized by their signatures, PIL is used for the rest
+    if header.startswith(b"\xff\xd8\xff"):
+        return "jpeg"
+    if header.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if header[:6] in (b"GIF87a", b"GIF89a"):
+        return "gif"
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return "webp"
+
     with Image.open(path) as img:
         return img.format.lower()
 
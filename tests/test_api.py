@@ -0,0 +1,267 @@
+# -*- coding: UTF-8 -*-
+"""
+Created on 15.10.26
+
+:author:     Martin Dočekal
+"""
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+from unittest import TestCase, mock
+
+import httpx
+import numpy as np
+from openai import APIError, NotFoundError
+
+from aicaller.api.api import API, OpenAPI
+from aicaller.api.base import APIOutput, APIRequest, OllamaAPIRequestBody, OpenAIAPIRequestBody
+
+
+class SleepingAPI(API):
+    """
+    API stub that sleeps for the number of seconds given in the request's model field.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def process_single_request(self, request: APIRequest) -> APIOutput:
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(float(request.body.model))
+        with self.lock:
+            self.in_flight -= 1
+        return APIOutput(custom_id=request.custom_id)
+
+    def batch_request(self, *args, **kwargs):
+        raise NotImplementedError
+
+    def wait_for_batch_request(self, *args, **kwargs):
+        raise NotImplementedError
+
+    def batch_request_and_wait(self, *args, **kwargs):
+        raise NotImplementedError
+
+
+class FakeClock:
+    """
+    Replacement of the time module that only advances when it is asked to sleep.
+    """
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class TestProcessRequests(TestCase):
+
+    SLEEPS = [0.2, 0.01, 0.15, 0.0, 0.1, 0.05, 0.3, 0.0, 0.02, 0.12]
+
+    def create_requests(self) -> list[APIRequest]:
+        return [
+            APIRequest(custom_id=str(i), body=OllamaAPIRequestBody(model=str(s), messages=[], options={}))
+            for i, s in enumerate(self.SLEEPS)
+        ]
+
+    def test_order_and_concurrency(self):
+        api = SleepingAPI(api_key="key", concurrency=3, process_requests_interval=0)
+        results = list(api.process_requests(self.create_requests()))
+
+        self.assertSequenceEqual([str(i) for i in range(len(self.SLEEPS))], [r.custom_id for r in results])
+        self.assertLessEqual(api.max_in_flight, 3)
+        self.assertGreater(api.max_in_flight, 1)
+
+    def paced_sleeps(self, interval: float, elapsed: float) -> list[float]:
+        """
+        Processes requests with a fake clock in the submitting thread and returns the requested pacing sleeps.
+
+        :param interval: Interval between requests.
+        :param elapsed: Time that passes before each request is obtained from the input iterable.
+        :return: Requested sleeps.
+        """
+        clock = FakeClock()
+
+        def requests():
+            for request in self.create_requests():
+                clock.now += elapsed
+                yield request
+
+        api = SleepingAPI(api_key="key", concurrency=3, process_requests_interval=interval)
+        with mock.patch("aicaller.api.api.time", clock):
+            results = list(api.process_requests(requests()))
+
+        self.assertSequenceEqual([str(i) for i in range(len(self.SLEEPS))], [r.custom_id for r in results])
+        self.assertLessEqual(api.max_in_flight, 3)
+        return clock.sleeps
+
+    def test_pacing(self):
+        sleeps = self.paced_sleeps(0.05, 0.0)
+        self.assertEqual(len(self.SLEEPS) - 1, len(sleeps))
+        for s in sleeps:
+            self.assertAlmostEqual(0.05, s)
+
+    def test_pacing_counts_elapsed_time(self):
+        sleeps = self.paced_sleeps(0.05, 0.03)
+        self.assertEqual(len(self.SLEEPS) - 1, len(sleeps))
+        for s in sleeps:
+            self.assertAlmostEqual(0.02, s)
+
+        self.assertSequenceEqual([], self.paced_sleeps(0.05, 0.06))
+
+    def test_no_pacing(self):
+        self.assertSequenceEqual([], self.paced_sleeps(0, 0.0))
+
+
+class TestGetLineIndex(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = str(Path(self.tmp_dir.name) / "requests.jsonl")
+        self.idx_path = self.path + ".lineidx"
+        with open(self.path, "wb") as f:
+            f.write(b'{"a":1}\n{"b":22}\n{"c":333}\n')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_build(self):
+        self.assertSequenceEqual([0, 8, 17], API._get_line_index(self.path).tolist())
+        self.assertTrue(os.path.exists(self.idx_path))
+        self.assertSequenceEqual([0, 8, 17], API._get_line_index(self.path).tolist())
+        self.assertSequenceEqual([self.idx_path], [str(p) for p in Path(self.tmp_dir.name).glob("*.lineidx*")])
+
+    def test_rebuild_when_file_replaced_with_older_mtime(self):
+        API._get_line_index(self.path)
+        mtime_ns = os.stat(self.path).st_mtime_ns
+        with open(self.path, "wb") as f:
+            f.write(b'{"a":1}\n{"b":2}\n')
+        os.utime(self.path, ns=(mtime_ns - 10 ** 9, mtime_ns - 10 ** 9))
+
+        self.assertSequenceEqual([0, 8], API._get_line_index(self.path).tolist())
+
+    def test_rebuild_corrupted_index(self):
+        API._get_line_index(self.path)
+        with open(self.idx_path, "r+b") as f:
+            f.truncate(os.path.getsize(self.idx_path) - 3)
+
+        self.assertSequenceEqual([0, 8, 17], API._get_line_index(self.path).tolist())
+        self.assertSequenceEqual([0, 8, 17], API._get_line_index(self.path).tolist())
+
+    def test_rebuild_empty_index(self):
+        open(self.idx_path, "wb").close()
+        self.assertSequenceEqual([0, 8, 17], API._get_line_index(self.path).tolist())
+
+    def test_empty_file(self):
+        open(self.path, "wb").close()
+        self.assertEqual(0, len(API._get_line_index(self.path)))
+        self.assertEqual(0, len(API._get_line_index(self.path)))
+
+    def test_no_trailing_newline(self):
+        with open(self.path, "wb") as f:
+            f.write(b'{"a":1}\n{"b":22}')
+        offsets = API._get_line_index(self.path)
+        self.assertEqual(np.uint64, offsets.dtype)
+        self.assertSequenceEqual([0, 8], offsets.tolist())
+
+
+class TestOpenAPIUploadBatchFile(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = str(Path(self.tmp_dir.name) / "requests.jsonl")
+        self.write_requests(2)
+
+        self.api = OpenAPI(api_key="key")
+        self.api.client = mock.Mock()
+        self.api.client.files.create.side_effect = [mock.Mock(id="file-1"), mock.Mock(id="file-2")]
+        self.api.client.batches.create.return_value = mock.Mock(id="batch")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def write_requests(self, n: int):
+        with open(self.path, "w") as f:
+            for i in range(n):
+                print(APIRequest(
+                    custom_id=str(i),
+                    body=OpenAIAPIRequestBody(
+                        model="gpt-4o", messages=[{"role": "user", "content": "Hi"}], temperature=1.0,
+                        logprobs=False, max_completion_tokens=10
+                    )
+                ).model_dump_json(), file=f)
+
+    @staticmethod
+    def not_found() -> NotFoundError:
+        return NotFoundError(
+            "File not found.",
+            response=httpx.Response(404, request=httpx.Request("GET", "https://api.openai.com/v1/files/file-1")),
+            body=None
+        )
+
+    def uploaded_file_ids(self) -> list[str]:
+        return [c.kwargs["input_file_id"] for c in self.api.client.batches.create.call_args_list]
+
+    def test_reuse_uploaded_file(self):
+        with mock.patch.object(self.api, "convert_batch_file", wraps=self.api.convert_batch_file) as convert:
+            self.api.batch_request(self.path)
+            self.api.batch_request(self.path)
+            convert.assert_called_once_with(self.path)
+
+        self.api.client.files.create.assert_called_once()
+        self.api.client.files.retrieve.assert_called_once_with("file-1")
+        self.assertSequenceEqual(["file-1", "file-1"], self.uploaded_file_ids())
+
+    def test_reupload_when_not_found(self):
+        self.api.client.files.retrieve.side_effect = self.not_found()
+        self.api.batch_request(self.path)
+        self.api.batch_request(self.path)
+
+        self.assertEqual(2, self.api.client.files.create.call_count)
+        self.assertSequenceEqual(["file-1", "file-2"], self.uploaded_file_ids())
+
+    def test_reupload_when_file_changed(self):
+        self.api.batch_request(self.path)
+        self.write_requests(3)
+        self.api.batch_request(self.path)
+
+        self.api.client.files.retrieve.assert_not_called()
+        self.assertEqual(2, self.api.client.files.create.call_count)
+        self.assertSequenceEqual(["file-1", "file-2"], self.uploaded_file_ids())
+        self.assertEqual(
+            3, len(self.api.client.files.create.call_args_list[1].kwargs["file"].getvalue().splitlines())
+        )
+
+    def test_single_upload_across_retries(self):
+        limit_reached = APIError(
+            "Enqueued token limit reached for gpt-4o.",
+            request=httpx.Request("POST", "https://api.openai.com/v1/batches"),
+            body=None
+        )
+        with mock.patch.object(self.api, "wait_for_batch_request", side_effect=[limit_reached, limit_reached, b""]), \
+                mock.patch("aicaller.api.api.time.sleep"):
+            self.assertSequenceEqual([], self.api.batch_request_and_wait(self.path))
+
+        self.api.client.files.create.assert_called_once()
+        self.assertSequenceEqual(["file-1", "file-1", "file-1"], self.uploaded_file_ids())
+
+    def test_cached_file_is_not_converted(self):
+        self.api.batch_request(self.path)
+        with mock.patch.object(self.api, "wait_for_batch_request", return_value=b""), \
+                mock.patch.object(self.api, "_prepare_batch", wraps=self.api._prepare_batch) as prepare:
+            self.api.batch_request_and_wait(self.path)
+            prepare.assert_called_once_with(self.path, convert=False)
+
+        self.api.client.files.create.assert_called_once()
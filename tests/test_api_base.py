@@ -0,0 +1,102 @@
+# -*- coding: UTF-8 -*-
+"""
+Created on 15.10.26
+
+:author:     Martin Dočekal
+"""
+from itertools import islice
+from unittest import TestCase
+
+from google.genai.types import GenerateContentResponse
+from ollama import ChatResponse
+from openai.types.chat import ChatCompletion
+
+from aicaller.api.base import APIBase, APIOutput, APIResponseOpenAI, APIResponseOllama, APIResponseGoogleGenAI
+
+CHAT_COMPLETION = {
+    "id": "chatcmpl-1",
+    "object": "chat.completion",
+    "created": 1700000000,
+    "model": "gpt-4o",
+    "choices": [
+        {"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": "first"}},
+        {"index": 1, "finish_reason": "stop", "message": {"role": "assistant", "content": "second"}}
+    ],
+    "usage": {"prompt_tokens": 5, "completion_tokens": 2, "total_tokens": 7}
+}
+
+OLLAMA_CHAT_RESPONSE = {
+    "model": "llama3.2:latest",
+    "created_at": "2024-11-15T10:00:00Z",
+    "done": True,
+    "done_reason": "stop",
+    "message": {"role": "assistant", "content": "Hello"},
+    "eval_count": 2
+}
+
+GENERATE_CONTENT_RESPONSE = {
+    "candidates": [{"content": {"role": "model", "parts": [{"text": "thinking", "thought": True}, {"text": "Hi"}]}}],
+    "modelVersion": "gemini-2.0-flash"
+}
+
+
+class TestAPIResponseBody(TestCase):
+
+    def assert_same_as_eager_dump(self, response_class, body, eager_body: dict) -> APIOutput:
+        lazy = APIOutput(custom_id="0", response=response_class(body=body, structured=False))
+        eager = APIOutput(custom_id="0", response=response_class(body=eager_body, structured=False))
+        self.assertEqual(eager.model_dump_json(), lazy.model_dump_json())
+        self.assertEqual(eager.model_dump(), lazy.model_dump())
+
+        round_tripped = APIOutput.model_validate_json(lazy.model_dump_json())
+        self.assertIsInstance(round_tripped.response.body, dict)
+        self.assertEqual(eager_body, round_tripped.response.body)
+        return round_tripped
+
+    def test_openai(self):
+        body = ChatCompletion.model_validate(CHAT_COMPLETION)
+        round_tripped = self.assert_same_as_eager_dump(APIResponseOpenAI, body, body.model_dump())
+
+        response = APIResponseOpenAI(body=body, structured=False)
+        for r in (response, round_tripped.response):
+            self.assertEqual("first", r.get_raw_content())
+            self.assertEqual("second", r.get_raw_content(1))
+
+    def test_ollama(self):
+        body = ChatResponse.model_validate(OLLAMA_CHAT_RESPONSE)
+        round_tripped = self.assert_same_as_eager_dump(APIResponseOllama, body, body.model_dump())
+
+        for r in (APIResponseOllama(body=body, structured=False), round_tripped.response):
+            self.assertEqual("Hello", r.get_raw_content())
+            with self.assertRaises(ValueError):
+                r.get_raw_content(0)
+
+    def test_google_gen_ai(self):
+        body = GenerateContentResponse.model_validate(GENERATE_CONTENT_RESPONSE)
+        eager_body = body.model_dump()
+        eager_body["text"] = body.text
+        round_tripped = self.assert_same_as_eager_dump(APIResponseGoogleGenAI, body, eager_body)
+
+        self.assertEqual("Hi", round_tripped.response.body["text"])
+        for r in (APIResponseGoogleGenAI(body=body, structured=False), round_tripped.response):
+            self.assertEqual("Hi", r.get_raw_content())
+            with self.assertRaises(ValueError):
+                r.get_raw_content(0)
+
+
+class TestPoolDelays(TestCase):
+
+    def assert_delays(self, initial_pool_interval: float, pool_interval: float, expected: list[float]):
+        api = APIBase(api_key="key", initial_pool_interval=initial_pool_interval, pool_interval=pool_interval)
+
+        delays = list(islice(api.pool_delays(), len(expected)))
+        for base, delay in zip(expected, delays):
+            self.assertGreaterEqual(delay, base)
+            self.assertLessEqual(delay, base * 1.1)
+        self.assertNotEqual(expected, delays)  # jitter is added
+
+    def test_exponential_backoff(self):
+        self.assert_delays(2, 30, [2, 4, 8, 16, 30, 30, 30])
+
+    def test_initial_above_max(self):
+        self.assert_delays(10, 5, [5, 5, 5])
@@ -0,0 +1,144 @@
+# -*- coding: UTF-8 -*-
+"""
+Created on 15.10.26
+
+:author:     Martin Dočekal
+"""
+import tempfile
+from pathlib import Path
+from unittest import TestCase, mock
+
+from google.genai.types import GenerateContentResponse, GenerateContentConfig, ThinkingConfig
+
+from aicaller.api.base import APIRequest, GoogleGenAIAPIRequestBody
+from aicaller.api.utils import GoogleGenAIAPIMixin, _load_cached_file_bytes
+
+
+class TestGoogleGenAIAPIMixinExtractText(TestCase):
+
+    def assert_same_as_sdk(self, response: dict, expected):
+        self.assertEqual(expected, GenerateContentResponse.model_validate(response).text)
+        self.assertEqual(expected, GoogleGenAIAPIMixin.extract_text(response))
+
+    def test_text_parts(self):
+        self.assert_same_as_sdk(
+            {"candidates": [
+                {"content": {"role": "model", "parts": [{"text": "Hello"}, {"text": " world"}]}},
+                {"content": {"role": "model", "parts": [{"text": "other candidate"}]}}
+            ]},
+            "Hello world"
+        )
+
+    def test_thought_and_text_parts(self):
+        self.assert_same_as_sdk(
+            {"candidates": [{"content": {"role": "model", "parts": [
+                {"text": "thinking", "thought": True},
+                {"text": "answer"},
+                {"text": " continues", "thought": False}
+            ]}}]},
+            "answer continues"
+        )
+
+    def test_only_thought_parts(self):
+        self.assert_same_as_sdk(
+            {"candidates": [{"content": {"role": "model", "parts": [{"text": "thinking", "thought": True}]}}]},
+            None
+        )
+
+    def test_empty_candidates(self):
+        self.assert_same_as_sdk({"candidates": []}, None)
+        self.assert_same_as_sdk({}, None)
+
+    def test_missing_content(self):
+        self.assert_same_as_sdk({"candidates": [{"finishReason": "SAFETY"}]}, None)
+
+    def test_empty_parts(self):
+        self.assert_same_as_sdk({"candidates": [{"content": {"role": "model", "parts": []}}]}, None)
+
+    def test_non_text_parts_only(self):
+        self.assert_same_as_sdk(
+            {"candidates": [{"content": {"role": "model", "parts": [
+                {"functionCall": {"name": "get_weather", "args": {"city": "Brno"}}},
+                {"inlineData": {"mimeType": "image/png", "data": "iVBORw0KGgo="}}
+            ]}}]},
+            None
+        )
+
+    def test_empty_string(self):
+        self.assert_same_as_sdk(
+            {"candidates": [{"content": {"role": "model", "parts": [{"text": ""}]}}]},
+            ""
+        )
+
+
+def get_weather(city: str) -> str:
+    return f"Sunny in {city}."
+
+
+class TestGoogleGenAIAPIMixinGetConfig(TestCase):
+
+    def create_request(self, options: dict, system: str = "Be brief.") -> APIRequest:
+        return APIRequest(
+            custom_id="0",
+            body=GoogleGenAIAPIRequestBody(
+                model="gemini-2.0-flash",
+                messages=[{"role": "system", "parts": [system]}, {"role": "user", "parts": ["Hi"]}],
+                options=options
+            )
+        )
+
+    def test_config(self):
+        config = GoogleGenAIAPIMixin.get_config(self.create_request({"temperature": 0.5}))
+        self.assertIsInstance(config, GenerateContentConfig)
+        self.assertEqual(0.5, config.temperature)
+        self.assertEqual("Be brief.", config.system_instruction.parts[0].text)
+
+    def test_cached_for_identical_inputs(self):
+        config = GoogleGenAIAPIMixin.get_config(self.create_request({"temperature": 0.5}))
+        self.assertIs(config, GoogleGenAIAPIMixin.get_config(self.create_request({"temperature": 0.5})))
+        self.assertIsNot(config, GoogleGenAIAPIMixin.get_config(self.create_request({"temperature": 0.7})))
+        self.assertIsNot(
+            config, GoogleGenAIAPIMixin.get_config(self.create_request({"temperature": 0.5}, system="Be verbose."))
+        )
+
+    def test_pydantic_model_option(self):
+        config = GoogleGenAIAPIMixin.get_config(
+            self.create_request({"thinking_config": ThinkingConfig(thinking_budget=128)})
+        )
+        self.assertEqual(128, config.thinking_config.thinking_budget)
+
+    def test_callable_tool_option(self):
+        config = GoogleGenAIAPIMixin.get_config(self.create_request({"tools": [get_weather]}))
+        self.assertEqual([get_weather], config.tools)
+
+
+class TestGoogleGenAIAPIMixinConvertPart(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        _load_cached_file_bytes.cache_clear()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+        _load_cached_file_bytes.cache_clear()
+
+    def write_file(self, name: str, size: int) -> str:
+        path = Path(self.tmp_dir.name) / name
+        path.write_bytes(b"\x01" * size)
+        return str(path)
+
+    def test_small_file_is_cached(self):
+        path = self.write_file("small.png", 10)
+        for _ in range(2):
+            self.assertEqual(b"\x01" * 10, GoogleGenAIAPIMixin.convert_part(("image/png", path)).inline_data.data)
+        self.assertEqual(1, _load_cached_file_bytes.cache_info().hits)
+        self.assertEqual(1, _load_cached_file_bytes.cache_info().currsize)
+
+    def test_large_file_is_not_cached(self):
+        path = self.write_file("large.png", 100)
+        with mock.patch("aicaller.api.utils.FILE_CACHE_MAX_FILE_SIZE", 50):
+            for _ in range(2):
+                self.assertEqual(
+                    b"\x01" * 100, GoogleGenAIAPIMixin.convert_part(("image/png", path)).inline_data.data
+                )
+        self.assertEqual(0, _load_cached_file_bytes.cache_info().currsize)
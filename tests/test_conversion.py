@@ -0,0 +1,155 @@
+# -*- coding: UTF-8 -*-
+"""
+Created on 15.10.26
+
+:author:     Martin Dočekal
+"""
+from concurrent.futures import Future
+from io import BytesIO
+from pathlib import Path
+from unittest import TestCase, mock
+
+from aicaller.conversion import ToOpenAIBatchFile, ToOllamaBatchFile, ToGoogleGenAIBatchFile
+from aicaller.few_shot_sampler import FewShotSampler
+from aicaller.loader import JSONLLoader, HFLoader
+from aicaller.sample_assembler import TextDatasetAssembler
+from aicaller.template import StringTemplate
+
+SCRIPT_PATH = Path(__file__).parent
+FIXTURES_PATH = SCRIPT_PATH / "fixtures"
+
+
+class TestToOpenAIBatchFile(TestCase):
+
+    def create_convertor(self, workers: int) -> ToOpenAIBatchFile:
+        return ToOpenAIBatchFile(
+            loader=JSONLLoader(path_to=str(FIXTURES_PATH / "dataset.jsonl")),
+            sample_assembler=TextDatasetAssembler(StringTemplate("This is the text of {{text}}."), id_fields=["id"]),
+            id_format="request-{{id}}-{{index}}",
+            model="gpt-4o",
+            temperature=1.0,
+            max_completion_tokens=100,
+            workers=workers
+        )
+
+    def test_convert(self):
+        requests = list(self.create_convertor(1).convert())
+
+        self.assertEqual(10, len(requests))
+        self.assertEqual(
+            '{"custom_id":"request-0-0","method":"POST","url":"/v1/chat/completions","body":{"model":"gpt-4o",'
+            '"messages":[{"role":"user","content":"This is the text of 0. sample."}],"type":"openai",'
+            '"temperature":1.0,"logprobs":false,"max_completion_tokens":100,"response_format":null}}',
+            requests[0]
+        )
+
+    def test_convert_workers(self):
+        convertor = self.create_convertor(3)
+        convertor.SHARD_SIZE = 2
+        self.assertSequenceEqual(list(self.create_convertor(1).convert()), list(convertor.convert()))
+
+    def test_convert_workers_few_shot(self):
+        def create(workers: int) -> ToOpenAIBatchFile:
+            few_shot_sampler = FewShotSampler(
+                load=HFLoader(path_to=str(FIXTURES_PATH / "dataset"), config="short", split="train"),
+                n=2,
+                seed=1
+            )
+            convertor = ToOpenAIBatchFile(
+                loader=JSONLLoader(path_to=str(FIXTURES_PATH / "dataset.jsonl")),
+                sample_assembler=TextDatasetAssembler(
+                    StringTemplate("{{few_shot_indices}} {{text}}"), few_shot_sampler=few_shot_sampler
+                ),
+                model="gpt-4o",
+                temperature=1.0,
+                max_completion_tokens=100,
+                workers=workers
+            )
+            convertor.SHARD_SIZE = 2
+            return convertor
+
+        self.assertSequenceEqual(list(create(1).convert()), list(create(3).convert()))
+
+    def test_convert_workers_bounded_in_flight(self):
+        submitted = []
+
+        class Executor:
+            def __init__(self, max_workers, initializer, initargs):
+                initializer(*initargs)
+
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *args):
+                return False
+
+            def submit(self, fn, *args):
+                submitted.append(args)
+                future = Future()
+                future.set_result(fn(*args))
+                return future
+
+        convertor = self.create_convertor(2)
+        convertor.SHARD_SIZE = 1
+        with mock.patch("aicaller.conversion.ProcessPoolExecutor", Executor):
+            requests = convertor.convert()
+            next(requests)
+            self.assertEqual(4, len(submitted))  # at most 2 * workers shards are submitted in advance
+            rest = list(requests)
+
+        self.assertEqual(9, len(rest))
+        self.assertEqual(10, len(submitted))
+
+    def test_convert_to_file(self):
+        out = BytesIO()
+        self.create_convertor(1).convert_to_file(out)
+        self.assertEqual(
+            "".join(line + "\n" for line in self.create_convertor(1).convert()),
+            out.getvalue().decode("utf-8")
+        )
+
+    def test_convert_id_format_with_expressions(self):
+        convertor = ToOpenAIBatchFile(
+            loader=JSONLLoader(path_to=str(FIXTURES_PATH / "dataset.jsonl")),
+            sample_assembler=TextDatasetAssembler(StringTemplate("This is the text of {{text}}.")),
+            id_format="req-{{ '%05d' % line_number }}-{{ line_number + 1 }}",
+            model="gpt-4o",
+            temperature=1.0,
+            max_completion_tokens=100
+        )
+        requests = list(convertor.convert())
+
+        self.assertTrue(requests[0].startswith('{"custom_id":"req-00000-1",'))
+        self.assertTrue(requests[9].startswith('{"custom_id":"req-00009-10",'))
+
+
+class TestToOllamaBatchFile(TestCase):
+
+    def test_convert_id_format_with_expressions(self):
+        convertor = ToOllamaBatchFile(
+            loader=JSONLLoader(path_to=str(FIXTURES_PATH / "dataset.jsonl")),
+            sample_assembler=TextDatasetAssembler(StringTemplate("This is the text of {{text}}.")),
+            id_format="req-{{ '%05d' % line_number }}-{{ line_number + 1 }}",
+            model="llama3.2:latest",
+            options={"temperature": 1.0}
+        )
+        requests = list(convertor.convert())
+
+        self.assertEqual(10, len(requests))
+        self.assertTrue(requests[9].startswith('{"custom_id":"req-00009-10",'))
+
+
+class TestToGoogleGenAIBatchFile(TestCase):
+
+    def test_convert_id_format_with_expressions(self):
+        convertor = ToGoogleGenAIBatchFile(
+            loader=JSONLLoader(path_to=str(FIXTURES_PATH / "dataset.jsonl")),
+            sample_assembler=TextDatasetAssembler(StringTemplate("This is the text of {{text}}.")),
+            id_format="req-{{ '%05d' % line_number }}-{{ line_number + 1 }}",
+            model="gemini-2.0-flash",
+            options={"max_output_tokens": 2048}
+        )
+        requests = list(convertor.convert())
+
+        self.assertEqual(10, len(requests))
+        self.assertTrue(requests[9].startswith('{"custom_id":"req-00009-10",'))
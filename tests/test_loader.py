@@ -74,6 +74,15 @@ class TestHFLoader(TestCase):
         self.assertDictEqual({"id": 5, "text": "5. test sample in long config"}, dataset[5])
         self.assertDictEqual({"id": 9, "text": "9. test sample in long config"}, dataset[9])
 
+    def test_load_streaming(self):
+        loader = HFLoader(path_to=str(FIXTURES_PATH / "dataset"), config="long", split="test", streaming=True)
+
+        dataset = list(loader.load())
+
+        self.assertEqual(10, len(dataset))
+        self.assertDictEqual({"id": 0, "text": "0. test sample in long config"}, dataset[0])
+        self.assertDictEqual({"id": 9, "text": "9. test sample in long config"}, dataset[9])
+
 
 class TestHFImageLoader(TestCase):
     def test_load(self):
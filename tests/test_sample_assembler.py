@@ -1,7 +1,7 @@
 from pathlib import Path
 from unittest import TestCase, mock
 
-from datasets import load_dataset
+from datasets import load_dataset, Dataset
 
 from aicaller.few_shot_sampler import FewShotSampler
 from aicaller.loader import HFLoader
@@ -45,6 +45,35 @@ class TestTextDatasetAssembler(TestCase):
         self.assertEqual("This is the text of 5. sample.", samples[1][0])
         self.assertEqual("This is the text of 9. sample.", samples[2][0])
 
+    def test_assembler_select_range(self):
+        assembler = TextDatasetAssembler(StringTemplate("This is the text of {{text}}."))
+
+        samples = list(assembler.assemble(self.dataset, select=range(4, 7)))
+        self.assertEqual(3, len(samples))
+        self.assertEqual("This is the text of 4. sample.", samples[0][0])
+        self.assertEqual({"line_number": 4}, samples[0][1])
+        self.assertEqual("This is the text of 6. sample.", samples[2][0])
+        self.assertEqual({"line_number": 6}, samples[2][1])
+
+    def test_assemble_duplicates_rendered_once(self):
+        dataset = Dataset.from_list([{"id": i, "text": f"{i % 2}. sample"} for i in range(6)])
+        template = StringTemplate("This is the text of {{text}}.")
+        assembler = TextDatasetAssembler(template, id_fields=["id"])
+
+        with mock.patch.object(template, "render", wraps=template.render) as render:
+            samples = list(assembler.assemble(dataset))
+
+        self.assertEqual(2, render.call_count)
+        self.assertEqual(["This is the text of 0. sample.", "This is the text of 1. sample."] * 3, [s for s, _ in samples])
+        self.assertEqual(list(range(6)), [ids["id"] for _, ids in samples])
+
+    def test_used_columns(self):
+        self.assertEqual(["text"], TextDatasetAssembler(StringTemplate("{{text}}")).used_columns(self.dataset))
+        self.assertEqual(["id", "text"],
+                         TextDatasetAssembler(StringTemplate("{{text}}"), id_fields=["id"]).used_columns(self.dataset))
+        self.assertEqual(["id"],
+                         TextDatasetAssembler(StringTemplate("{{text}}"), direct="id").used_columns(self.dataset))
+
     def test_assembler_few_shot(self):
         loader = HFLoader(
             path_to=str(FIXTURES_PATH / "dataset"),
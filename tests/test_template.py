@@ -4,21 +4,60 @@ Created on 17.02.25
 
 :author:     Martin Dočekal
 """
+import pickle
 from pathlib import Path
 from unittest import TestCase
 from aicaller.template import StringTemplate, SegmentedStringTemplate, OpenAIMessageBuilder, OpenAITextContent, \
-    OpenAIImageContent, OpenAIMultiModalMessageBuilder, OllamaMessageBuilder, MessagesTemplate
+    OpenAIImageContent, OpenAIMultiModalMessageBuilder, OllamaMessageBuilder, MessagesTemplate, to_format_string, \
+    compile_template, FormatStringRenderer, Jinja2EnvironmentSingletonFactory
 
 SCRIPT_PATH = Path(__file__).parent
 FIXTURES_PATH = SCRIPT_PATH / "fixtures"
 
 
+class TestCompileTemplate(TestCase):
+
+    def test_to_format_string(self):
+        self.assertEqual("request-{index}", to_format_string("request-{{index}}"))
+        self.assertEqual("req-{id}-{index}", to_format_string("req-{{ id }}-{{index}}"))
+        self.assertEqual("a{{b}}-{index}", to_format_string("a{b}-{{index}}"))
+        self.assertEqual("a\nb {x}", to_format_string("a\r\nb {{x}}\n"))
+
+    def test_to_format_string_unsupported(self):
+        self.assertIsNone(to_format_string("{{ id|upper }}"))
+        self.assertIsNone(to_format_string("{{- id }}"))
+        self.assertIsNone(to_format_string("{% if id %}{{id}}{% endif %}"))
+        self.assertIsNone(to_format_string("{# comment #}{{id}}"))
+        self.assertIsNone(to_format_string("{{ none }}-{{index}}"))
+        self.assertIsNone(to_format_string("{{ 0 }}"))
+
+    def test_compile_template(self):
+        self.assertIsInstance(compile_template("Hello {{name}}!"), FormatStringRenderer)
+        self.assertNotIsInstance(compile_template("Hello {{name|upper}}!"), FormatStringRenderer)
+
+    def test_same_as_jinja(self):
+        jinja_env = Jinja2EnvironmentSingletonFactory().jinja_env
+        data = {"index": 3, "id": "q", "line_number": None, "values": [1, 2.5]}
+        for source in ["request-{{index}}", "req-{{ id }}-{{line_number}}-{{index}}", "a{b}-{{index}}",
+                       "x}}{{values}}", "Hello\r\n{{id}}\n", "{{missing}}-{{index}}", ""]:
+            self.assertEqual(jinja_env.from_string(source).render(data), compile_template(source).render(data))
+
+
 class TestStringTemplate(TestCase):
 
     def test_render(self):
         template = StringTemplate("Hello {{name}}!")
         self.assertEqual("Hello Alan!", template.render({"name": "Alan"}))
 
+    def test_pickle(self):
+        for source in ["Hello {{name}}!", "Hello {{name|upper}}!"]:
+            template = pickle.loads(pickle.dumps(StringTemplate(source)))
+            self.assertEqual(StringTemplate(source).render({"name": "Alan"}), template.render({"name": "Alan"}))
+
+    def test_variables(self):
+        template = StringTemplate("Hello {{name}}{% for s in few_shot %}{{ s.text }}{% endfor %}!")
+        self.assertEqual({"name", "few_shot"}, template.variables())
+
 
 class TestSegmentedStringTemplate(TestCase):
 
@@ -177,3 +216,19 @@ class TestMessagesTemplate(TestCase):
                 ]
             }
         ], res)
+
+    def test_variables(self):
+        template = MessagesTemplate([
+            OpenAIMessageBuilder(
+                role="system",
+                content="You are {{system}}!"
+            ),
+            OpenAIMultiModalMessageBuilder(
+                role="user",
+                content=[
+                    OpenAITextContent(text="Hello {{assistant}}!"),
+                    OpenAIImageContent(url="{{filename}}")
+                ]
+            ),
+        ])
+        self.assertEqual({"system", "assistant", "filename"}, template.variables())
@@ -0,0 +1,88 @@
+# -*- coding: UTF-8 -*-
+"""
+Created on 15.10.26
+
+:author:     Martin Dočekal
+"""
+import json
+import tempfile
+from pathlib import Path
+from unittest import TestCase, mock
+
+from PIL import Image
+
+from aicaller.utils import jsonl_field_value_2_file_offset_mapping, iter_lines, detect_image_format
+
+SCRIPT_PATH = Path(__file__).parent
+FIXTURES_PATH = SCRIPT_PATH / "fixtures"
+
+
+class TestIterLines(TestCase):
+
+    def test_iter_lines(self):
+        self.assertSequenceEqual(
+            [(0, b"a"), (2, b""), (3, b"bc")], list(iter_lines(b"a\n\nbc\n"))
+        )
+        self.assertSequenceEqual([(0, b"a"), (2, b"bc")], list(iter_lines(b"a\nbc")))
+        self.assertSequenceEqual([], list(iter_lines(b"")))
+
+
+class TestJsonlFieldValue2FileOffsetMapping(TestCase):
+
+    def full_parse_mapping(self, path: Path, field: str) -> dict:
+        mapping = {}
+        offset = 0
+        with open(path, "rb") as f:
+            for line in f:
+                mapping[json.loads(line)[field]] = offset
+                offset += len(line)
+        return mapping
+
+    def test_mapping(self):
+        path = FIXTURES_PATH / "custom_ids.jsonl"
+        self.assertFalse(path.read_bytes().endswith(b"\n"))
+
+        mapping = jsonl_field_value_2_file_offset_mapping(str(path), "custom_id")
+
+        self.assertEqual(self.full_parse_mapping(path, "custom_id"), mapping)
+        self.assertEqual(
+            {"compact", "x", "not-first", 'esc"aped', 42, "čeština-日本", "last"},
+            set(mapping.keys())
+        )
+
+    def test_other_field(self):
+        path = FIXTURES_PATH / "dataset.jsonl"
+        self.assertEqual(
+            self.full_parse_mapping(path, "text"), jsonl_field_value_2_file_offset_mapping(str(path), "text")
+        )
+
+    def test_empty_file(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = Path(tmp_dir) / "empty.jsonl"
+            path.write_bytes(b"")
+            self.assertEqual({}, jsonl_field_value_2_file_offset_mapping(str(path), "custom_id"))
+
+
+class TestDetectImageFormat(TestCase):
+
+    def test_signatures(self):
+        with mock.patch("aicaller.utils.Image.open") as pil_open:
+            self.assertEqual("jpeg", detect_image_format(str(FIXTURES_PATH / "pixel.jpg")))
+            self.assertEqual("png", detect_image_format(str(FIXTURES_PATH / "pixel.png")))
+            pil_open.assert_not_called()
+
+    def test_same_as_pil(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for pil_format in ["GIF", "WEBP", "BMP", "TIFF"]:
+                path = str(Path(tmp_dir) / f"pixel.{pil_format.lower()}")
+                Image.new("RGB", (1, 1)).save(path, format=pil_format)
+                with Image.open(path) as img:
+                    self.assertEqual(img.format.lower(), detect_image_format(path))
+
+    def test_pil_fallback(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = str(Path(tmp_dir) / "pixel.bmp")
+            Image.new("RGB", (1, 1)).save(path, format="BMP")
+            with mock.patch("aicaller.utils.Image.open", wraps=Image.open) as pil_open:
+                self.assertEqual("bmp", detect_image_format(path))
+                pil_open.assert_called_once_with(path)